@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""
+Times the core SOP traversals on deep synthetic types
+
+    python -m benchmarks.traversals [depth ...]
+
+A depth that a traversal can't cope with shows up as the error
+instead of a time
+"""
+
+from dataclasses import make_dataclass
+import sys
+from time import perf_counter
+from typing import Any, Callable
+
+from frozendict import frozendict
+
+from csv_dataflow.sop import (
+    UNIT,
+    VOID,
+    SumProductChild,
+    SumProductNode,
+)
+from csv_dataflow.sop.from_type import sop_from_type
+from csv_dataflow.sop.lazy import lazy_sop_from_type
+
+DEFAULT_DEPTHS = (100, 1_000, 3_000)
+
+
+def nested_type(depth: int) -> type[Any]:
+    """
+    Dataclasses each with a field of the next, and an int
+
+    The fields are named by level, as unanchored paths that match
+    at every level multiply as they go down
+    """
+    t: type[Any] = int
+    for i in range(depth):
+        t = make_dataclass(
+            f"Nested{i}", [(f"x{i}", t), (f"y{i}", int)]
+        )
+    return t
+
+
+def nested_sop(depth: int) -> SumProductNode[Any]:
+    """What `sop_from_type(nested_type(depth))` should be"""
+    sop: SumProductNode[Any] = VOID
+    for i in range(depth):
+        sop = SumProductNode(
+            "*",
+            frozendict[str, SumProductChild](
+                {f"x{i}": sop, f"y{i}": VOID}
+            ),
+        )
+    return sop
+
+
+def looped_sop(depth: int) -> SumProductNode[Any]:
+    """
+    `nested_sop`, but each level's y is a de Bruijn index all the
+    way back to the root
+    """
+    sop: SumProductNode[Any] = VOID
+    for i in range(depth):
+        sop = SumProductNode(
+            "*",
+            frozendict[str, SumProductChild](
+                {f"x{i}": sop, f"y{i}": depth - 1 - i}
+            ),
+        )
+    return sop
+
+
+def unrolled_list(length: int) -> SumProductNode[Any]:
+    """Clip for `list[int]` unrolled `length` times"""
+    sop: SumProductNode[Any] = UNIT
+    for _ in range(length):
+        sop = SumProductNode(
+            "+",
+            frozendict[str, SumProductChild](
+                {
+                    "empty": UNIT,
+                    "list": SumProductNode(
+                        "*",
+                        frozendict[str, SumProductChild](
+                            {"head": UNIT, "tail": sop}
+                        ),
+                    ),
+                }
+            ),
+        )
+    return sop
+
+
+def timed(f: Callable[[], object], repeat: int = 5) -> str:
+    """Best of `repeat`"""
+    best = float("inf")
+    for _ in range(repeat):
+        start = perf_counter()
+        try:
+            f()
+        except RecursionError:
+            return "RecursionError"
+        best = min(best, perf_counter() - start)
+    return f"{best:.4f}s"
+
+
+def main(depths: tuple[int, ...]) -> None:
+    for depth in depths:
+        t = nested_type(depth)
+        sop = nested_sop(depth)
+        deepest = tuple(f"x{i}" for i in reversed(range(depth)))
+        list_sop = sop_from_type(list[int])
+        unrolled = unrolled_list(depth)
+        looped = looped_sop(depth)
+
+        results = {
+            "sop_from_type": lambda: sop_from_type(t),
+            "lazy_sop_from_type + at": lambda: lazy_sop_from_type(
+                t
+            ).at(
+                deepest
+            ),
+            "map_data": lambda: sop.map_data(lambda _: True),
+            "map_data (lazy) + at": lambda: sop.map_data(
+                lambda _: True, lazy=True
+            ).at(deepest),
+            "add_values_at_paths": lambda: sop.add_values_at_paths(
+                {(*deepest, "1")}
+            ),
+            "filter_to_paths": lambda: sop.filter_to_paths(
+                {deepest}
+            ),
+            "iter_leaf_paths": lambda: tuple(
+                sop.iter_leaf_paths()
+            ),
+            "merge": lambda: sop.merge(sop),
+            "clip (unrolled list)": lambda: list_sop.clip(
+                unrolled
+            ),
+            "clip (back to root)": lambda: looped.clip(sop),
+            "map_data (unrolled list)": lambda: unrolled.map_data(
+                lambda _: True
+            ),
+        }
+
+        print(f"depth {depth}")
+        for name, f in results.items():
+            print(f"  {name:<26}{timed(f)}")
+
+
+if __name__ == "__main__":
+    main(tuple(map(int, sys.argv[1:])) or DEFAULT_DEPTHS)
@@ -6,34 +6,29 @@ T = TypeVar("T", covariant=True)
 type ConsList[T] = Cons[T] | None
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class Cons(Generic[T]):
     head: T
     tail: ConsList[T]
 
 
 def at_index[T](l: ConsList[T], i: int) -> T:
+    assert i >= 0
+    for _ in range(i):
+        assert l
+        l = l.tail
     assert l
-    if i == 0:
-        return l.head
-    else:
-        assert i > 0
-        return at_index(l.tail, i - 1)
+    return l.head
 
 
 def to_cons_list[T](it: Iterable[T]) -> ConsList[T]:
-    try:
-        item = next(iter(it))
-        return Cons(item, to_cons_list(it))
-    except StopIteration:
-        return None
+    l: ConsList[T] = None
+    for item in reversed(tuple(it)):
+        l = Cons(item, l)
+    return l
 
 
 def iter_cons_list[T](l: ConsList[T]) -> Iterator[T]:
-    match l:
-        case Cons(head, tail):
-            yield head
-            for v in iter_cons_list(tail):
-                yield v
-        case None:
-            return
+    while l is not None:
+        yield l.head
+        l = l.tail
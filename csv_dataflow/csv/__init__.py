@@ -0,0 +1,936 @@
+import csv
+from dataclasses import dataclass, field, replace
+from frozendict import frozendict
+from itertools import batched, repeat
+from pathlib import Path
+from typing import (
+    Any,
+    Collection,
+    Iterable,
+    Iterator,
+    Literal,
+    Mapping,
+    Sequence,
+)
+
+from csv_dataflow.relation.intern import RelationInterner
+from csv_dataflow.relation.triple import ParallelTriple
+from csv_dataflow.sop.from_type import sop_from_type
+from csv_dataflow.sop.paths.add_values import add_values_at_trie
+from csv_dataflow.sop.paths.trie import PathTrie
+
+from ..env import Env, push
+from ..relation import (
+    BasicRelation,
+    Between,
+    ParallelRelation,
+)
+from ..sop import (
+    DeBruijn,
+    SumProductChild,
+    SumProductNode,
+)
+
+
+def select_given_csv_paths[T](
+    sop: SumProductNode[T],
+    name_paths: tuple[tuple[str, ...], ...],
+    immediate_name_paths: tuple[tuple[str, ...], ...] = (),
+    prev_stack: Env[SumProductNode[T]] | None = None,
+) -> SumProductNode[T] | None:
+    """
+    Will also include open de Bruijn indices as they could still
+    be put in a context that matches
+    """
+    selected, _ = _select_given_tries(
+        sop,
+        PathTrie.from_paths(name_paths),
+        (
+            (PathTrie.from_paths(immediate_name_paths),)
+            if immediate_name_paths
+            else ()
+        ),
+        True,
+        prev_stack,
+        _SelectCache(),
+    )
+    return selected
+
+
+type _RecursionFlags = tuple[bool, int]
+"""
+`only_has_de_bruijn_indices` and
+`max_de_bruijn_index_relative_to_current_node`
+"""
+
+
+def _combine_recursion_flags(
+    children: Collection[_RecursionFlags],
+) -> _RecursionFlags:
+    """From the flags of the children, as seen from the parent"""
+    if not children:
+        # Terminal node is data
+        return False, 0
+
+    return (
+        all(only for only, _ in children),
+        max(index for _, index in children),
+    )
+
+
+def _as_child_flags(
+    child: SumProductChild, flags: _RecursionFlags | None
+) -> _RecursionFlags:
+    if isinstance(child, int):
+        return True, child
+
+    assert flags is not None
+    only, index = flags
+    return only, index - 1
+
+
+@dataclass
+class _SelectCache:
+    """Shared by one `select_given_csv_paths` call, keyed by id"""
+
+    unmatched: dict[
+        int,
+        tuple[
+            SumProductNode[Any] | None, _RecursionFlags | None
+        ],
+    ] = field(
+        default_factory=dict[
+            int,
+            tuple[
+                SumProductNode[Any] | None,
+                _RecursionFlags | None,
+            ],
+        ]
+    )
+
+
+def _select_given_tries[T](
+    sop: SumProductNode[T],
+    trie: PathTrie,
+    immediate: tuple[PathTrie, ...],
+    new_matches: bool,
+    prev_stack: Env[SumProductNode[T]] | None,
+    cache: _SelectCache,
+) -> tuple[SumProductNode[T] | None, _RecursionFlags | None]:
+    """
+    Also returns the selection's recursion flags, built up from its
+    children's instead of walking it again for
+    `is_empty_recursion`
+    """
+    if any(state.is_end for state in immediate):
+        # We matched to the end of a name_path
+        return sop, sop.recursion_flags()
+
+    # Nothing can match in here, so the selection only depends
+    # on the node
+    unmatched = not new_matches and not immediate
+    if unmatched and id(sop) in cache.unmatched:
+        return cache.unmatched[id(sop)]
+
+    stack = push(prev_stack, sop)
+
+    # The filtered children have either one or more given paths, or
+    # open de Bruijn indices, or both
+    # Children not containing any selected paths return None (again,
+    # unless they have open de Bruijn indices)
+    children: dict[str, SumProductChild] = {}
+    children_flags: list[_RecursionFlags] = []
+    for path, child in sop.children.items():
+        child_immediate = tuple(
+            state.children[path]
+            for state in (
+                (trie, *immediate) if new_matches else immediate
+            )
+            if path in state.children
+        )
+        if not isinstance(child, int):
+            selected, flags = _select_given_tries(
+                child,
+                trie,
+                child_immediate,
+                new_matches,
+                stack,
+                cache,
+            )
+        elif child_immediate:
+            # No new matches in the mirror realm
+            selected, flags = _select_given_tries(
+                stack[child],
+                trie,
+                child_immediate,
+                False,
+                stack,
+                cache,
+            )
+        else:
+            selected, flags = child, None
+
+        if selected is not None:
+            children[path] = selected
+            children_flags.append(
+                _as_child_flags(selected, flags)
+            )
+
+    result: tuple[
+        SumProductNode[T] | None, _RecursionFlags | None
+    ] = (None, None)
+    flags = _combine_recursion_flags(children_flags)
+    only_de_bruijn, max_index = flags
+    # Otherwise it's empty or an empty recursion
+    if children and not (only_de_bruijn and max_index <= 0):
+        result = (
+            replace(
+                sop,
+                children=frozendict[str, SumProductChild](
+                    children
+                ),
+            ),
+            flags,
+        )
+
+    if unmatched:
+        cache.unmatched[id(sop)] = result
+    return result
+
+
+def _select_children[T](
+    sop: SumProductNode[T],
+    children: Mapping[str, SumProductChild | None],
+) -> SumProductNode[T] | None:
+    filtered_sop = replace(
+        sop,
+        children=frozendict[str, SumProductChild](
+            {
+                path: child
+                for path, child in children.items()
+                if child is not None
+            }
+        ),
+    )
+
+    if (
+        not filtered_sop.children
+        or filtered_sop.is_empty_recursion()
+    ):
+        return None
+
+    return filtered_sop
+
+
+def _select_rows_given_trie[T](
+    sop: SumProductNode[T],
+    trie: PathTrie,
+    immediate: tuple[PathTrie, ...],
+    new_matches: bool,
+    prev_stack: Env[SumProductNode[T]] | None,
+    overlapping: set[int],
+) -> tuple[
+    dict[int, SumProductNode[T] | None], SumProductNode[T] | None
+]:
+    """
+    Returns the selection for each row with a path reaching into
+    `sop`, and the selection shared by all the rows without one
+    """
+    stack = push(prev_stack, sop)
+
+    child_selections: dict[
+        str,
+        tuple[
+            Mapping[int, SumProductChild | None],
+            SumProductChild | None,
+        ],
+    ] = {}
+    for path, child in sop.children.items():
+        child_immediate = tuple(
+            state.children[path]
+            for state in (
+                (trie, *immediate) if new_matches else immediate
+            )
+            if path in state.children
+        )
+        if not isinstance(child, int):
+            child_selections[path] = _select_rows_given_trie(
+                child,
+                trie,
+                child_immediate,
+                new_matches,
+                stack,
+                overlapping,
+            )
+        elif child_immediate:
+            # No new matches in the mirror realm
+            unrolled, unrolled_default = _select_rows_given_trie(
+                stack[child],
+                trie,
+                child_immediate,
+                False,
+                stack,
+                overlapping,
+            )
+            child_selections[path] = (
+                {
+                    row: unrolled.get(row, unrolled_default)
+                    for state in child_immediate
+                    for row in state.labels
+                },
+                child,
+            )
+        else:
+            child_selections[path] = ({}, child)
+
+    default = _select_children(
+        sop,
+        {
+            path: child_default
+            for path, (
+                _,
+                child_default,
+            ) in child_selections.items()
+        },
+    )
+
+    # We matched to the end of one of these rows' paths
+    selections: dict[int, SumProductNode[T] | None] = {
+        row: sop for state in immediate for row in state.ends
+    }
+    if sop.children:
+        # The value was named the same as a child, so this has
+        # other rows' values in it too
+        overlapping.update(selections)
+
+    # Only the children a row's paths reach can differ from the
+    # default, so each row only looks at those
+    differing: dict[
+        int, list[tuple[int, str, SumProductChild | None]]
+    ] = {}
+    for position, (path, (selected, child_default)) in enumerate(
+        child_selections.items()
+    ):
+        for row, child in selected.items():
+            if (
+                row not in selections
+                and child is not child_default
+            ):
+                differing.setdefault(row, []).append(
+                    (position, path, child)
+                )
+    default_children = tuple(
+        (position, path, child_default)
+        for position, (path, (_, child_default)) in enumerate(
+            child_selections.items()
+        )
+        if child_default is not None
+    )
+
+    # Rows picking the same children share the node, keyed on just
+    # what they pick differently
+    shared: dict[
+        tuple[tuple[str, int], ...], SumProductNode[T] | None
+    ] = {}
+    for row in {
+        row
+        for selected, _ in child_selections.values()
+        for row in selected
+        if row not in selections
+    }:
+        row_children = differing.get(row)
+        if row_children is None:
+            selections[row] = default
+            continue
+
+        key = tuple(
+            (path, id(child)) for _, path, child in row_children
+        )
+        if key not in shared:
+            picked = {path for _, path, _ in row_children}
+            shared[key] = _select_children(
+                sop,
+                {
+                    path: child
+                    for _, path, child in sorted(
+                        (
+                            *row_children,
+                            *(
+                                item
+                                for item in default_children
+                                if item[1] not in picked
+                            ),
+                        ),
+                        key=lambda item: item[0],
+                    )
+                },
+            )
+        selections[row] = shared[key]
+
+    return selections, default
+
+
+def select_rows_given_csv_paths[T](
+    sop: SumProductNode[T], trie: PathTrie, rows: int
+) -> tuple[tuple[SumProductNode[T] | None, ...], set[int]]:
+    """
+    `select_given_csv_paths` for every row at once, from a trie of
+    all the rows' paths labelled with their row index
+
+    Walks `sop` once for all the rows. Rows with no paths into a
+    subtree share one selection of it, and the result for each
+    row is built out of `sop`'s own nodes
+
+    Also returns the rows with a path ending on a node that has
+    children. If `sop` has more than the row's own values added,
+    those rows picked up the extras and need selecting again
+    against an SOP with just theirs
+    """
+    overlapping: set[int] = set()
+    selections, default = _select_rows_given_trie(
+        sop, trie, (), True, None, overlapping
+    )
+    return (
+        tuple(
+            selections.get(row, default) for row in range(rows)
+        ),
+        overlapping,
+    )
+
+
+class Source: ...
+
+
+class Target: ...
+
+
+End = Source | Target
+
+type IngestMode = Literal["per_row", "trie"]
+"""
+per_row: add each row's values to the type SOP and select from
+         that, one row at a time
+trie:    put every row's value paths in one trie, add them all to
+         the type SOP in one pass and select every row from that
+         in another (same result, but the type SOP isn't rewalked
+         per row)
+"""
+
+type CSVReader = Literal["text", "mmap"]
+"""
+text: the csv module over the file opened as text
+mmap: memory-map the file and split rows without quotes on
+      commas as bytes, only decoding (and interning) the cells
+      that aren't blank (same result, much less allocation for
+      big, sparse CSVs)
+"""
+
+type ValuePaths = tuple[tuple[str, ...], ...]
+
+
+class UnknownCSVColumns(Exception):
+    def __init__(self, names: Collection[str]):
+        super().__init__(
+            "These CSV columns don't match any path in their"
+            f" side's type: {", ".join(map(repr, names))}"
+        )
+
+
+@dataclass(frozen=True)
+class CSVColumn:
+    index: int
+    """Position in the row"""
+    end: End
+    name_path: tuple[str, ...]
+    nodes: tuple[SumProductNode[Any], ...]
+    """Every node in the type that `name_path` lands on"""
+
+
+@dataclass(frozen=True)
+class CSVColumnPlan:
+    """
+    The header resolved once up front, so rows only need to look
+    at the cells of real columns
+    """
+
+    source: tuple[CSVColumn, ...]
+    target: tuple[CSVColumn, ...]
+
+    def value_paths(
+        self, row: Sequence[str]
+    ) -> tuple[ValuePaths, ValuePaths]:
+        """Source and target value paths of a row"""
+        return (
+            _column_value_paths(self.source, row),
+            _column_value_paths(self.target, row),
+        )
+
+
+def _column_value_paths(
+    columns: tuple[CSVColumn, ...], row: Sequence[str]
+) -> ValuePaths:
+    return tuple(
+        (*column.name_path, value)
+        for column in columns
+        if column.index < len(row)
+        for value in (row[column.index],)
+        # Blank value (for now) means no connection
+        if value != ""
+    )
+
+
+def csv_name_to_name_path(csv_name: str) -> tuple[str, ...]:
+    return tuple(map(str.strip, csv_name.split("/")))
+
+
+def _resolve_name_paths[T](
+    sop: SumProductNode[T],
+    trie: PathTrie,
+    immediate: tuple[PathTrie, ...],
+    new_matches: bool,
+    prev_stack: Env[SumProductNode[T]] | None,
+    resolved: dict[int, list[SumProductNode[Any]]],
+) -> None:
+    """Matches the same way as `select_given_csv_paths`"""
+    for state in immediate:
+        for column in state.ends:
+            resolved[column].append(sop)
+
+    stack = push(prev_stack, sop)
+
+    for path, child in sop.children.items():
+        child_immediate = tuple(
+            state.children[path]
+            for state in (
+                (trie, *immediate) if new_matches else immediate
+            )
+            if path in state.children
+        )
+        if not isinstance(child, int):
+            _resolve_name_paths(
+                child,
+                trie,
+                child_immediate,
+                new_matches,
+                stack,
+                resolved,
+            )
+        elif child_immediate:
+            # No new matches in the mirror realm
+            _resolve_name_paths(
+                stack[child],
+                trie,
+                child_immediate,
+                False,
+                stack,
+                resolved,
+            )
+
+
+def _resolve_columns(
+    sop: SumProductNode[Any],
+    end: End,
+    header: Sequence[str],
+    indices: Sequence[int],
+) -> tuple[CSVColumn, ...]:
+    trie = PathTrie()
+    for index in indices:
+        trie.add(csv_name_to_name_path(header[index]), index)
+
+    resolved: dict[int, list[SumProductNode[Any]]] = {
+        index: [] for index in indices
+    }
+    _resolve_name_paths(sop, trie, (), True, None, resolved)
+
+    return tuple(
+        CSVColumn(
+            index,
+            end,
+            csv_name_to_name_path(header[index]),
+            tuple(resolved[index]),
+        )
+        for index in indices
+    )
+
+
+def compile_csv_header(
+    header: Sequence[str],
+    sop_s: SumProductNode[Any],
+    sop_t: SumProductNode[Any],
+) -> CSVColumnPlan:
+    """
+    Source columns come before the first blank-named column and
+    target columns after it. Raises `UnknownCSVColumns` if any
+    column can't be found in its side's type
+    """
+    # Blank is the separator for now
+    separator = next(
+        (
+            index
+            for index, name in enumerate(header)
+            if name.strip() == ""
+        ),
+        len(header),
+    )
+    non_blank = tuple(
+        index
+        for index, name in enumerate(header)
+        if name.strip() != ""
+    )
+
+    plan = CSVColumnPlan(
+        _resolve_columns(
+            sop_s,
+            Source(),
+            header,
+            tuple(
+                index for index in non_blank if index < separator
+            ),
+        ),
+        _resolve_columns(
+            sop_t,
+            Target(),
+            header,
+            tuple(
+                index for index in non_blank if index > separator
+            ),
+        ),
+    )
+
+    unknown = tuple(
+        header[column.index]
+        for column in (*plan.source, *plan.target)
+        if not column.nodes
+    )
+    if unknown:
+        raise UnknownCSVColumns(unknown)
+
+    return plan
+
+
+def iter_csv_value_paths(
+    csv_path: Path,
+    sop_s: SumProductNode[Any],
+    sop_t: SumProductNode[Any],
+    reader: CSVReader = "text",
+) -> Iterator[tuple[ValuePaths, ValuePaths]]:
+    """Source and target value paths of each row"""
+    match reader:
+        case "text":
+            with open(csv_path) as f:
+                yield from iter_csv_lines_value_paths(
+                    f, sop_s, sop_t
+                )
+        case "mmap":
+            yield from iter_mapped_csv_value_paths(
+                csv_path, sop_s, sop_t
+            )
+
+
+def iter_csv_lines_value_paths(
+    lines: Iterable[str],
+    sop_s: SumProductNode[Any],
+    sop_t: SumProductNode[Any],
+) -> Iterator[tuple[ValuePaths, ValuePaths]]:
+    """`iter_csv_value_paths` for a CSV that's already been read"""
+    rows = csv.reader(lines)
+
+    plan = compile_csv_header(next(rows, ()), sop_s, sop_t)
+
+    for row in rows:
+        # Same as DictReader
+        if not row:
+            continue
+
+        yield plan.value_paths(row)
+
+
+def parallel_relation_from_csv[S, T](
+    s: type[S],
+    t: type[T],
+    csv_path: Path,
+    mode: IngestMode = "per_row",
+    reader: CSVReader = "text",
+) -> ParallelTriple[S, T]:
+    sop_s = sop_from_type(s)
+    sop_t = sop_from_type(t)
+
+    return parallel_relation_from_value_paths(
+        sop_s,
+        sop_t,
+        iter_csv_value_paths(csv_path, sop_s, sop_t, reader),
+        mode,
+    )
+
+
+def parallel_relation_from_value_paths[S, T](
+    sop_s: SumProductNode[S],
+    sop_t: SumProductNode[T],
+    rows: Iterable[tuple[ValuePaths, ValuePaths]],
+    mode: IngestMode = "per_row",
+) -> ParallelTriple[S, T]:
+    """
+    For rows that have already been read into value paths
+
+    Either way, the result is hash-consed, so identical rows, and
+    identical subtrees within and between rows, are shared objects
+    """
+    match mode:
+        case "per_row":
+            triple = _parallel_relation_per_row(
+                sop_s, sop_t, rows
+            )
+        case "trie":
+            triple = _parallel_relation_from_tries(
+                sop_s, sop_t, rows
+            )
+
+    interner = RelationInterner()
+    source = interner.node(triple.source)
+    target = interner.node(triple.target)
+    return ParallelTriple(
+        interner.parallel_relation(triple.relation),
+        source=source,
+        target=target,
+    )
+
+
+def relation_given_csv_paths[S, T](
+    sop_s: SumProductNode[S],
+    sop_t: SumProductNode[T],
+    source_value_paths: ValuePaths,
+    target_value_paths: ValuePaths,
+) -> BasicRelation[S, T]:
+    """One row's relation, from just that row's values"""
+    source = select_given_csv_paths(
+        sop_s.add_values_at_paths(source_value_paths),
+        source_value_paths,
+    )
+    assert source is not None
+    target = select_given_csv_paths(
+        sop_t.add_values_at_paths(target_value_paths),
+        target_value_paths,
+    )
+    assert target is not None
+
+    return BasicRelation(source, target)
+
+
+@dataclass
+class ValueAugmentedSOP[T]:
+    """
+    A type SOP plus the values added to it so far
+
+    Only the distinct value paths are kept, so this stays the
+    same size however many rows repeat them. `with_values` is
+    rebuilt when it's next asked for after a new one turns up
+    """
+
+    sop: SumProductNode[T]
+    value_paths: PathTrie = field(default_factory=PathTrie)
+    _with_values: SumProductNode[T] | None = None
+
+    def add(self, value_paths: ValuePaths) -> None:
+        for path in value_paths:
+            if path not in self.value_paths:
+                self.value_paths.add(path)
+                self._with_values = None
+
+    @property
+    def with_values(self) -> SumProductNode[T]:
+        if self._with_values is None:
+            with_values = add_values_at_trie(
+                self.sop, self.value_paths
+            )
+            assert not isinstance(with_values, DeBruijn)
+            self._with_values = with_values
+
+        return self._with_values
+
+
+STREAM_BATCH_ROWS = 4096
+"""How many rows a "trie" mode stream reads ahead at a time"""
+
+
+@dataclass
+class CSVRelationStream[S, T]:
+    """
+    Yields each row's relation as it's read, keeping nothing from
+    earlier rows but their values in `source` and `target`
+
+    In "trie" mode rows are read `batch_rows` at a time, and each
+    batch's relations are worked out together
+    """
+
+    rows: Iterable[tuple[ValuePaths, ValuePaths]]
+    source: ValueAugmentedSOP[S]
+    target: ValueAugmentedSOP[T]
+    mode: IngestMode = "per_row"
+    batch_rows: int = STREAM_BATCH_ROWS
+
+    def __iter__(
+        self,
+    ) -> Iterator[tuple[BasicRelation[S, T], Between[S, T]]]:
+        between = Between[S, T]((), ())
+        match self.mode:
+            case "per_row":
+                for (
+                    source_value_paths,
+                    target_value_paths,
+                ) in self.rows:
+                    self.source.add(source_value_paths)
+                    self.target.add(target_value_paths)
+
+                    yield relation_given_csv_paths(
+                        self.source.sop,
+                        self.target.sop,
+                        source_value_paths,
+                        target_value_paths,
+                    ), between
+            case "trie":
+                for batch in batched(self.rows, self.batch_rows):
+                    for (
+                        source_value_paths,
+                        target_value_paths,
+                    ) in batch:
+                        self.source.add(source_value_paths)
+                        self.target.add(target_value_paths)
+
+                    relations, _, _ = _relations_from_tries(
+                        self.source.sop, self.target.sop, batch
+                    )
+                    for relation in relations:
+                        yield relation, between
+
+
+def iter_relations_from_csv[S, T](
+    s: type[S],
+    t: type[T],
+    csv_path: Path,
+    mode: IngestMode = "per_row",
+    reader: CSVReader = "text",
+) -> CSVRelationStream[S, T]:
+    """
+    Iterate over it for the `ParallelRelation` children one row at
+    a time. Memory doesn't grow with the number of rows, only with
+    the number of distinct values
+    """
+    sop_s = sop_from_type(s)
+    sop_t = sop_from_type(t)
+
+    return CSVRelationStream(
+        iter_csv_value_paths(csv_path, sop_s, sop_t, reader),
+        ValueAugmentedSOP(sop_s),
+        ValueAugmentedSOP(sop_t),
+        mode,
+    )
+
+
+def _parallel_relation_per_row[S, T](
+    sop_s: SumProductNode[S],
+    sop_t: SumProductNode[T],
+    rows: Iterable[tuple[ValuePaths, ValuePaths]],
+) -> ParallelTriple[S, T]:
+    stream = CSVRelationStream(
+        rows, ValueAugmentedSOP(sop_s), ValueAugmentedSOP(sop_t)
+    )
+
+    return ParallelTriple(
+        ParallelRelation(tuple(stream)),
+        source=stream.source.with_values,
+        target=stream.target.with_values,
+    )
+
+
+def _parallel_relation_from_tries[S, T](
+    sop_s: SumProductNode[S],
+    sop_t: SumProductNode[T],
+    rows: Iterable[tuple[ValuePaths, ValuePaths]],
+) -> ParallelTriple[S, T]:
+    relations, source, target = _relations_from_tries(
+        sop_s, sop_t, tuple(rows)
+    )
+    return ParallelTriple(
+        ParallelRelation(
+            tuple(zip(relations, repeat(Between[S, T]((), ()))))
+        ),
+        source=source,
+        target=target,
+    )
+
+
+def _relations_from_tries[S, T](
+    sop_s: SumProductNode[S],
+    sop_t: SumProductNode[T],
+    value_paths: Sequence[tuple[ValuePaths, ValuePaths]],
+) -> tuple[
+    list[BasicRelation[S, T]],
+    SumProductNode[S],
+    SumProductNode[T],
+]:
+    """
+    Each row's relation, and the SOPs with every row's values
+
+    Selecting from the SOP with every row's values is the same as
+    selecting from the SOP with just that row's values: the extra
+    value leaves are never on the row's paths so get dropped
+
+    (Except where a value shares its name with a child, which
+    `select_rows_given_csv_paths` picks out for redoing)
+    """
+    source_trie = PathTrie()
+    target_trie = PathTrie()
+
+    for row, (
+        source_value_paths,
+        target_value_paths,
+    ) in enumerate(value_paths):
+        for path in source_value_paths:
+            source_trie.add(path, row)
+        for path in target_value_paths:
+            target_trie.add(path, row)
+
+    sop_s_with_all_values = add_values_at_trie(
+        sop_s, source_trie
+    )
+    assert not isinstance(sop_s_with_all_values, DeBruijn)
+    sop_t_with_all_values = add_values_at_trie(
+        sop_t, target_trie
+    )
+    assert not isinstance(sop_t_with_all_values, DeBruijn)
+
+    sources, overlapping_sources = select_rows_given_csv_paths(
+        sop_s_with_all_values, source_trie, len(value_paths)
+    )
+    targets, overlapping_targets = select_rows_given_csv_paths(
+        sop_t_with_all_values, target_trie, len(value_paths)
+    )
+
+    relations: list[BasicRelation[S, T]] = []
+    for row, (source, target) in enumerate(
+        zip(sources, targets)
+    ):
+        if (
+            row in overlapping_sources
+            or row in overlapping_targets
+        ):
+            relations.append(
+                relation_given_csv_paths(
+                    sop_s, sop_t, *value_paths[row]
+                )
+            )
+            continue
+
+        assert source is not None
+        assert target is not None
+        relations.append(BasicRelation(source, target))
+
+    return (
+        relations,
+        sop_s_with_all_values,
+        sop_t_with_all_values,
+    )
+
+
+# Implementations
+from csv_dataflow.csv.mapped import iter_mapped_csv_value_paths
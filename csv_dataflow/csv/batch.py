@@ -0,0 +1,123 @@
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+import os
+from pathlib import Path
+from typing import Any, Iterable, Mapping
+
+from csv_dataflow.csv import (
+    IngestMode,
+    iter_csv_value_paths,
+    parallel_relation_from_value_paths,
+)
+from csv_dataflow.relation.intern import RelationInterner
+from csv_dataflow.relation.triple import ParallelTriple
+from csv_dataflow.sop import SumProductNode
+from csv_dataflow.sop.from_type import sop_from_type
+
+
+@dataclass(frozen=True)
+class CSVSpec[S, T]:
+    source: type[S]
+    target: type[T]
+    csv_path: Path
+
+
+@dataclass(frozen=True)
+class CSVBatch:
+    triples: tuple[ParallelTriple[Any, Any], ...]
+    """In the same order as the specs"""
+    type_sops: Mapping[type, SumProductNode[Any]]
+    value_sops: Mapping[type, SumProductNode[Any]]
+    """Each type with the values from every CSV it's used in"""
+
+
+def _relation_from_csv[S, T](
+    sop_s: SumProductNode[S],
+    sop_t: SumProductNode[T],
+    csv_path: Path,
+    mode: IngestMode,
+) -> ParallelTriple[S, T]:
+    return parallel_relation_from_value_paths(
+        sop_s,
+        sop_t,
+        iter_csv_value_paths(csv_path, sop_s, sop_t),
+        mode,
+    )
+
+
+def parallel_relations_from_csvs(
+    specs: Iterable[CSVSpec[Any, Any]],
+    max_workers: int | None = None,
+    mode: IngestMode = "per_row",
+) -> CSVBatch:
+    """
+    `parallel_relation_from_csv` for each spec, each CSV in its own
+    process, with each type's SOP only built once
+
+    Everything that comes back goes through the same
+    `RelationInterner`, so equal SOP subtrees and rows are shared
+    between the triples and `value_sops`
+    """
+    specs = tuple(specs)
+
+    type_sops: dict[type, SumProductNode[Any]] = {}
+    for spec in specs:
+        for t in (spec.source, spec.target):
+            if t not in type_sops:
+                type_sops[t] = sop_from_type(t)
+
+    if len(specs) <= 1:
+        triples = tuple(
+            _relation_from_csv(
+                type_sops[spec.source],
+                type_sops[spec.target],
+                spec.csv_path,
+                mode,
+            )
+            for spec in specs
+        )
+    else:
+        with ProcessPoolExecutor(
+            min(max_workers or os.cpu_count() or 1, len(specs))
+        ) as executor:
+            futures = tuple(
+                executor.submit(
+                    _relation_from_csv,
+                    type_sops[spec.source],
+                    type_sops[spec.target],
+                    spec.csv_path,
+                    mode,
+                )
+                for spec in specs
+            )
+            triples = tuple(
+                future.result() for future in futures
+            )
+
+    with_values: dict[type, list[SumProductNode[Any]]] = {}
+    for spec, triple in zip(specs, triples):
+        with_values.setdefault(spec.source, []).append(
+            triple.source
+        )
+        with_values.setdefault(spec.target, []).append(
+            triple.target
+        )
+
+    interner = RelationInterner()
+    value_sops = {
+        t: interner.node(first.merge(*rest))
+        for t, (first, *rest) in with_values.items()
+    }
+
+    return CSVBatch(
+        tuple(
+            ParallelTriple(
+                interner.parallel_relation(triple.relation),
+                source=interner.node(triple.source),
+                target=interner.node(triple.target),
+            )
+            for triple in triples
+        ),
+        {t: interner.node(sop) for t, sop in type_sops.items()},
+        value_sops,
+    )
@@ -0,0 +1,264 @@
+from dataclasses import dataclass
+import hashlib
+import logging
+import os
+from pathlib import Path
+import pickle
+import tempfile
+from threading import Lock
+from typing import Any, cast
+from weakref import finalize
+
+from csv_dataflow.csv import (
+    IngestMode,
+    iter_csv_value_paths,
+    parallel_relation_from_value_paths,
+)
+from csv_dataflow.fold import fold
+from csv_dataflow.relation.triple import ParallelTriple
+from csv_dataflow.sop import SumProductChild, SumProductNode
+from csv_dataflow.sop.from_type import sop_from_type
+
+_logger = logging.getLogger(__name__)
+
+FORMAT_VERSION = 1
+"""Bump when ingest output changes, to orphan old entries"""
+
+HASH_BLOCK_BYTES = 1 << 20
+
+
+type _FingerprintItem = tuple[str | None, SumProductChild]
+"""The child's name (None for the root) and the child"""
+
+_fingerprints: dict[int, str] = {}
+"""By id, dropped when the SOP goes"""
+_fingerprints_lock = Lock()
+
+
+def sop_fingerprint(sop: SumProductNode[Any]) -> str:
+    """
+    Hash of the shape of `sop` (not its data) that stays the same
+    between runs, unlike `hash`
+
+    Remembered for as long as `sop` is alive, so a type's SOP
+    (which `sop_from_type` keeps) only gets hashed once
+    """
+    with _fingerprints_lock:
+        fingerprint = _fingerprints.get(id(sop))
+    if fingerprint is not None:
+        return fingerprint
+
+    hasher = hashlib.sha256()
+    update = hasher.update
+
+    def expand(
+        item: _FingerprintItem,
+    ) -> tuple[bool, tuple[_FingerprintItem, ...]]:
+        name, child = item
+        if name is not None:
+            encoded_name = name.encode()
+            update(f"{len(encoded_name)}:".encode())
+            update(encoded_name)
+        if isinstance(child, int):
+            update(f"#{child}".encode())
+            return False, ()
+
+        update(f"{child.sop}{len(child.children)}(".encode())
+        return True, tuple(child.children.items())
+
+    def combine(is_node: bool, _: list[None]) -> None:
+        if is_node:
+            update(b")")
+
+    # Depth first, children in order, so it's written out the
+    # same as it would be recursively
+    fold((None, sop), expand, combine)
+
+    fingerprint = hasher.hexdigest()
+    with _fingerprints_lock:
+        if id(sop) not in _fingerprints:
+            _fingerprints[id(sop)] = fingerprint
+            finalize(sop, _forget_fingerprint, id(sop))
+    return fingerprint
+
+
+def _forget_fingerprint(sop_id: int) -> None:
+    with _fingerprints_lock:
+        _fingerprints.pop(sop_id, None)
+
+
+def bytes_digest(data: bytes) -> str:
+    """Same as `file_digest` of a file containing `data`"""
+    return hashlib.sha256(data).hexdigest()
+
+
+_file_digests: dict[Path, tuple[tuple[int, int], str]] = {}
+"""Only the latest for each file, with its size and mtime"""
+
+
+def file_digest(path: Path) -> str:
+    """
+    Hash of the file's content, remembered for as long as its size
+    and modification time stay the same
+    """
+    stat = path.stat()
+    resolved = path.resolve()
+    stat_key = (stat.st_size, stat.st_mtime_ns)
+    remembered = _file_digests.get(resolved)
+    if remembered is not None and remembered[0] == stat_key:
+        return remembered[1]
+
+    hasher = hashlib.sha256()
+    with open(path, "rb") as f:
+        while block := f.read(HASH_BLOCK_BYTES):
+            hasher.update(block)
+    digest = hasher.hexdigest()
+    # Replacing whatever it was before it changed
+    _file_digests[resolved] = (stat_key, digest)
+    return digest
+
+
+@dataclass(frozen=True)
+class RelationCache:
+    """
+    Pickled ingest results, one file per key, under `directory`
+
+    Reading an entry marks it as recently used. Least recently
+    used entries are deleted once there are more than `max_bytes`
+    of them, or more than `max_entries`
+    """
+
+    directory: Path = Path(".relation_cache")
+    max_bytes: int = 1 << 30
+    max_entries: int | None = None
+
+    def entry_path(self, key: str) -> Path:
+        return self.directory / f"{key}.pickle"
+
+    def load(self, key: str) -> Any | None:
+        path = self.entry_path(key)
+        try:
+            with open(path, "rb") as f:
+                value = pickle.load(f)
+            os.utime(path)
+        except (FileNotFoundError, NotADirectoryError):
+            # Nothing stored, or nowhere to store it
+            return None
+        except (
+            OSError,
+            EOFError,
+            pickle.UnpicklingError,
+            # From classes that have since been moved or renamed
+            AttributeError,
+            ImportError,
+        ):
+            # Half written by something that died, or otherwise
+            # broken, so just redo it
+            path.unlink(missing_ok=True)
+            return None
+
+        return value
+
+    def store(self, key: str, value: Any) -> None:
+        """
+        If it can't be stored (the disk's full, `value` doesn't
+        pickle...) that's logged, and it's just not there next time
+        """
+        temp_path = None
+        try:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            # Write then rename so readers never see a partial
+            # entry
+            with tempfile.NamedTemporaryFile(
+                dir=self.directory, suffix=".tmp", delete=False
+            ) as f:
+                temp_path = Path(f.name)
+                pickle.dump(value, f, pickle.HIGHEST_PROTOCOL)
+            os.replace(temp_path, self.entry_path(key))
+        except Exception:
+            _logger.warning(
+                "Couldn't store %s in %s",
+                key,
+                self.directory,
+                exc_info=True,
+            )
+            if temp_path is not None:
+                temp_path.unlink(missing_ok=True)
+            return
+
+        self.evict()
+
+    def evict(self) -> None:
+        entries: list[tuple[int, int, Path]] = []
+        for path in self.directory.glob("*.pickle"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append(
+                (stat.st_mtime_ns, stat.st_size, path)
+            )
+
+        # Most recently used first
+        entries.sort(reverse=True)
+
+        total_bytes = 0
+        for count, (_, size, path) in enumerate(entries, 1):
+            total_bytes += size
+            if total_bytes > self.max_bytes or (
+                self.max_entries is not None
+                and count > self.max_entries
+            ):
+                path.unlink(missing_ok=True)
+
+
+def relation_cache_key(
+    sop_s: SumProductNode[Any],
+    sop_t: SumProductNode[Any],
+    csv_digest: str,
+    mode: IngestMode = "per_row",
+) -> str:
+    """`csv_digest` being a `file_digest` or `bytes_digest`"""
+    return hashlib.sha256(
+        ":".join(
+            (
+                str(FORMAT_VERSION),
+                sop_fingerprint(sop_s),
+                sop_fingerprint(sop_t),
+                csv_digest,
+                mode,
+            )
+        ).encode()
+    ).hexdigest()
+
+
+def cached_parallel_relation_from_csv[S, T](
+    s: type[S],
+    t: type[T],
+    csv_path: Path,
+    cache: RelationCache = RelationCache(),
+    mode: IngestMode = "per_row",
+) -> ParallelTriple[S, T]:
+    """
+    `parallel_relation_from_csv`, unless the same CSV content has
+    been ingested against the same shaped types before
+    """
+    sop_s = sop_from_type(s)
+    sop_t = sop_from_type(t)
+
+    key = relation_cache_key(
+        sop_s, sop_t, file_digest(csv_path), mode
+    )
+
+    cached = cache.load(key)
+    if cached is not None:
+        return cast(ParallelTriple[S, T], cached)
+
+    triple = parallel_relation_from_value_paths(
+        sop_s,
+        sop_t,
+        iter_csv_value_paths(csv_path, sop_s, sop_t),
+        mode,
+    )
+    cache.store(key, triple)
+    return triple
@@ -0,0 +1,259 @@
+from dataclasses import dataclass, field
+from pathlib import Path
+import threading
+from typing import cast
+
+from csv_dataflow.csv import (
+    IngestMode,
+    ValuePaths,
+    iter_csv_lines_value_paths,
+    parallel_relation_from_value_paths,
+)
+from csv_dataflow.csv.cache import (
+    RelationCache,
+    bytes_digest,
+    relation_cache_key,
+)
+from csv_dataflow.csv.parallel import decode_csv_bytes
+from csv_dataflow.relation import (
+    BasicRelation,
+    Between,
+    ParallelRelation,
+)
+from csv_dataflow.relation.triple import ParallelTriple
+from csv_dataflow.sop import DeBruijn, SumProductNode
+from csv_dataflow.sop.from_type import sop_from_type
+from csv_dataflow.sop.paths.add_values import add_values_at_trie
+from csv_dataflow.sop.paths.trie import PathTrie
+
+type RowValuePaths = tuple[ValuePaths, ValuePaths]
+
+
+type _WithValues[T] = tuple[
+    SumProductNode[T], ValuePaths, PathTrie | None
+]
+"""A value SOP, its value paths and their trie if there is one"""
+
+
+def _with_values[T](
+    sop: SumProductNode[T],
+    value_paths: ValuePaths,
+    prev: _WithValues[T] | None = None,
+) -> _WithValues[T]:
+    """
+    If all of `prev`'s paths are still there, only the new ones
+    get added to it. `prev`'s trie gets reused if they were
+    appended, so it's changed
+    """
+    with_values: SumProductNode[T] | DeBruijn
+    if prev is not None:
+        prev_sop, prev_value_paths, trie = prev
+        if value_paths == prev_value_paths:
+            return prev
+        if (
+            trie is not None
+            and value_paths[: len(prev_value_paths)]
+            == prev_value_paths
+        ):
+            for path in value_paths[len(prev_value_paths) :]:
+                trie.add(path)
+        elif set(prev_value_paths) <= set(value_paths):
+            # Still in the order of the paths, like a rebuild's
+            trie = PathTrie.from_paths(value_paths)
+        else:
+            trie = None
+        if trie is not None:
+            with_values = add_values_at_trie(
+                prev_sop, trie, values_added=True
+            )
+            assert not isinstance(with_values, DeBruijn)
+            return with_values, value_paths, trie
+
+    trie = PathTrie.from_paths(value_paths)
+    with_values = add_values_at_trie(sop, trie)
+    assert not isinstance(with_values, DeBruijn)
+    return with_values, value_paths, trie
+
+
+@dataclass
+class IncrementalCSVRelation[S, T]:
+    """
+    A CSV's `ParallelTriple`, kept up to date with the file by
+    `refresh`
+
+    Rows are remembered by their value paths, so a reload only
+    selects for rows that weren't there last time. New distinct
+    values get added to the value SOPs from last time, they're only
+    rebuilt if some went away. (The file itself is still reread,
+    which is cheap next to selecting)
+    """
+
+    sop_s: SumProductNode[S]
+    sop_t: SumProductNode[T]
+    csv_path: Path
+    cache: RelationCache | None = None
+    """Where the first load comes from, if it's been done before"""
+    mode: IngestMode = "per_row"
+
+    _relations: dict[RowValuePaths, BasicRelation[S, T]] = field(
+        default_factory=dict[RowValuePaths, BasicRelation[S, T]]
+    )
+    _source_value_paths: ValuePaths = ()
+    _target_value_paths: ValuePaths = ()
+    _source_trie: PathTrie | None = None
+    _target_trie: PathTrie | None = None
+    _triple: ParallelTriple[S, T] | None = None
+    _stat: tuple[int, int] | None = None
+    _lock: threading.Lock = field(default_factory=threading.Lock)
+
+    @property
+    def triple(self) -> ParallelTriple[S, T]:
+        self.refresh()
+        assert self._triple is not None
+        return self._triple
+
+    def refresh(self) -> bool:
+        """
+        Reload if the file's size or modification time changed,
+        returning whether it did
+
+        Meant to be called whenever the triple's about to be used,
+        e.g. on each request in a long running server
+        """
+        with self._lock:
+            stat = self.csv_path.stat()
+            stat_key = (stat.st_mtime_ns, stat.st_size)
+            if stat_key == self._stat:
+                return False
+
+            # Taken before reading, so a write during the read
+            # gets picked up next time. Only kept once the reload
+            # has worked, so a broken file gets retried until fixed
+            self._reload(self.csv_path.read_bytes())
+            self._stat = stat_key
+            return True
+
+    def _reload(self, data: bytes) -> None:
+        rows = tuple(
+            iter_csv_lines_value_paths(
+                decode_csv_bytes(data), self.sop_s, self.sop_t
+            )
+        )
+
+        cache_key = None
+        if self._triple is None and self.cache is not None:
+            cache_key = relation_cache_key(
+                self.sop_s,
+                self.sop_t,
+                bytes_digest(data),
+                self.mode,
+            )
+            cached = self.cache.load(cache_key)
+            if cached is not None:
+                self._load_cached(
+                    rows, cast(ParallelTriple[S, T], cached)
+                )
+                return
+
+        relations = {
+            row: self._relations[row]
+            for row in rows
+            if row in self._relations
+        }
+        new_rows = tuple(
+            row
+            for row in dict.fromkeys(rows)
+            if row not in relations
+        )
+        if new_rows:
+            new = parallel_relation_from_value_paths(
+                self.sop_s, self.sop_t, new_rows, self.mode
+            )
+            for row, (relation, _) in zip(
+                new_rows, new.relation.children
+            ):
+                assert isinstance(relation, BasicRelation)
+                relations[row] = relation
+        self._relations = relations
+
+        source_value_paths, target_value_paths = _distinct(rows)
+        prev_source = prev_target = None
+        if self._triple is not None:
+            prev_source = (
+                self._triple.source,
+                self._source_value_paths,
+                self._source_trie,
+            )
+            prev_target = (
+                self._triple.target,
+                self._target_value_paths,
+                self._target_trie,
+            )
+        source, self._source_value_paths, self._source_trie = (
+            _with_values(
+                self.sop_s, source_value_paths, prev_source
+            )
+        )
+        target, self._target_value_paths, self._target_trie = (
+            _with_values(
+                self.sop_t, target_value_paths, prev_target
+            )
+        )
+
+        between = Between[S, T]((), ())
+        self._triple = ParallelTriple(
+            ParallelRelation(
+                tuple((relations[row], between) for row in rows)
+            ),
+            source=source,
+            target=target,
+        )
+
+        if cache_key is not None:
+            assert self.cache is not None
+            self.cache.store(cache_key, self._triple)
+
+    def _load_cached(
+        self,
+        rows: tuple[RowValuePaths, ...],
+        triple: ParallelTriple[S, T],
+    ) -> None:
+        relations: dict[RowValuePaths, BasicRelation[S, T]] = {}
+        for row, (relation, _) in zip(
+            rows, triple.relation.children
+        ):
+            assert isinstance(relation, BasicRelation)
+            relations[row] = relation
+
+        self._relations = relations
+        self._source_value_paths, self._target_value_paths = (
+            _distinct(rows)
+        )
+        self._triple = triple
+
+
+def _distinct(
+    rows: tuple[RowValuePaths, ...],
+) -> tuple[ValuePaths, ValuePaths]:
+    """Every row's value paths, in the order they first turn up"""
+    return tuple(
+        dict.fromkeys(
+            path for source, _ in rows for path in source
+        )
+    ), tuple(
+        dict.fromkeys(
+            path for _, target in rows for path in target
+        )
+    )
+
+
+def incremental_relation_from_csv[S, T](
+    s: type[S],
+    t: type[T],
+    csv_path: Path,
+    cache: RelationCache | None = None,
+    mode: IngestMode = "per_row",
+) -> IncrementalCSVRelation[S, T]:
+    return IncrementalCSVRelation(
+        sop_from_type(s), sop_from_type(t), csv_path, cache, mode
+    )
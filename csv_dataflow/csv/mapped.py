@@ -0,0 +1,182 @@
+import csv
+from dataclasses import dataclass, field
+import io
+import locale
+import mmap
+import os
+from pathlib import Path
+import sys
+from typing import Any, Iterator
+
+from csv_dataflow.csv import ValuePaths, compile_csv_header
+from csv_dataflow.sop import SumProductNode
+
+BLOCK_BYTES = 1 << 20
+
+
+def _iter_row_bytes(
+    data: mmap.mmap,
+) -> Iterator[tuple[bytes, bool]]:
+    """
+    Each row's bytes, without the final newline, and whether it
+    needs the real parser (quotes, so newlines in it might not end
+    the row, or old Mac newlines)
+
+    Goes a block at a time, just splitting on newlines when there
+    are no quotes in the block
+    """
+    size = len(data)
+    position = 0
+    while position < size:
+        block_end = data.find(
+            b"\n", min(position + BLOCK_BYTES, size - 1)
+        )
+        block_end = size if block_end == -1 else block_end + 1
+        block = data[position:block_end]
+
+        if b'"' not in block:
+            rows = block.split(b"\n")
+            if block.endswith(b"\n"):
+                rows.pop()
+            for row in rows:
+                yield row.removesuffix(b"\r"), b"\r" in row[:-1]
+            position = block_end
+            continue
+
+        while position < block_end:
+            row, position = _quoted_row(data, position)
+            yield row, True
+
+
+def _quoted_row(
+    data: mmap.mmap, position: int
+) -> tuple[bytes, int]:
+    """The row starting at `position`, and where the next starts"""
+    size = len(data)
+    end = data.find(b"\n", position)
+    if end == -1:
+        end = size
+    row = data[position:end]
+    quotes = row.count(b'"')
+
+    while quotes % 2 == 1 and end < size:
+        next_end = data.find(b"\n", end + 1)
+        if next_end == -1:
+            next_end = size
+        rest = data[end:next_end]
+        quotes += rest.count(b'"')
+        row += rest
+        end = next_end
+
+    return row, end + 1
+
+
+def _parse(row: bytes, encoding: str) -> Iterator[list[str]]:
+    """With the same newline handling as `open`"""
+    return csv.reader(
+        io.TextIOWrapper(io.BytesIO(row + b"\n"), encoding)
+    )
+
+
+@dataclass
+class _ByteColumns:
+    """
+    `CSVColumnPlan.value_paths` for one end, for rows still split
+    into bytes
+
+    Each column's value paths are remembered by the cell's bytes,
+    so a value is only decoded (and interned) the first time it
+    turns up in a column
+    """
+
+    columns: tuple[tuple[int, tuple[str, ...]], ...]
+    encoding: str
+    value_paths: dict[tuple[int, bytes], tuple[str, ...]] = (
+        field(
+            default_factory=dict[
+                tuple[int, bytes], tuple[str, ...]
+            ]
+        )
+    )
+
+    def __call__(self, cells: list[bytes]) -> ValuePaths:
+        value_paths: list[tuple[str, ...]] = []
+        for index, name_path in self.columns:
+            if index >= len(cells):
+                continue
+            cell = cells[index]
+            # Blank value (for now) means no connection
+            if not cell:
+                continue
+
+            value_path = self.value_paths.get((index, cell))
+            if value_path is None:
+                value_path = self.value_paths[(index, cell)] = (
+                    *name_path,
+                    sys.intern(cell.decode(self.encoding)),
+                )
+            value_paths.append(value_path)
+
+        return tuple(value_paths)
+
+
+def iter_mapped_csv_value_paths(
+    csv_path: Path,
+    sop_s: SumProductNode[Any],
+    sop_t: SumProductNode[Any],
+    encoding: str | None = None,
+) -> Iterator[tuple[ValuePaths, ValuePaths]]:
+    """
+    `iter_csv_value_paths`, but tokenizing the memory-mapped file
+    straight into positional lists of cells
+
+    Rows without quotes are split on commas as bytes, and only
+    cells that aren't blank get decoded. Defaults to the same
+    encoding as `open`
+    """
+    encoding = encoding or locale.getpreferredencoding(False)
+
+    with open(csv_path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            compile_csv_header((), sop_s, sop_t)
+            return
+
+        with mmap.mmap(
+            f.fileno(), 0, access=mmap.ACCESS_READ
+        ) as data:
+            rows = _iter_row_bytes(data)
+
+            header, _ = next(rows)
+            parsed = _parse(header, encoding)
+            plan = compile_csv_header(
+                next(parsed, ()), sop_s, sop_t
+            )
+            source, target = (
+                _ByteColumns(
+                    tuple(
+                        (column.index, column.name_path)
+                        for column in columns
+                    ),
+                    encoding,
+                )
+                for columns in (plan.source, plan.target)
+            )
+
+            # Anything after the header an old Mac newline hid
+            for cells in parsed:
+                if cells:
+                    yield plan.value_paths(cells)
+
+            for row, needs_parser in rows:
+                if not needs_parser:
+                    # Same as DictReader
+                    if not row:
+                        continue
+
+                    cells = row.split(b",")
+                    yield source(cells), target(cells)
+                    continue
+
+                for cells in _parse(row, encoding):
+                    if cells:
+                        yield plan.value_paths(cells)
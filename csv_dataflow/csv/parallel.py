@@ -0,0 +1,182 @@
+import csv
+from concurrent.futures import ProcessPoolExecutor
+import io
+import os
+from pathlib import Path
+from typing import BinaryIO, Iterator
+
+from csv_dataflow.csv import (
+    CSVColumnPlan,
+    IngestMode,
+    ValuePaths,
+    compile_csv_header,
+    parallel_relation_from_value_paths,
+)
+from csv_dataflow.relation import ParallelRelation
+from csv_dataflow.relation.triple import ParallelTriple
+from csv_dataflow.sop import SumProductNode
+from csv_dataflow.sop.from_type import sop_from_type
+
+CHUNK_BYTES = 1 << 20
+
+BLOCK_BYTES = 1 << 16
+
+
+def _row_end_after(
+    f: BinaryIO, row_start: int, offset: int
+) -> int:
+    """
+    Offset just past the first row ending at or after `offset`
+
+    Newlines inside quotes don't end a row, so this counts quotes
+    from `row_start` (which has to be the start of a row) to know
+    whether it's inside them
+    """
+    f.seek(row_start)
+    position = row_start
+    quoted = False
+    while block := f.read(BLOCK_BYTES):
+        # Only the quotes matter before `offset`
+        start = min(max(offset - position, 0), len(block))
+        quoted ^= block.count(b'"', 0, start) % 2 == 1
+
+        while (newline := block.find(b"\n", start)) != -1:
+            quoted ^= block.count(b'"', start, newline) % 2 == 1
+            if not quoted:
+                return position + newline + 1
+            start = newline + 1
+
+        quoted ^= block.count(b'"', start) % 2 == 1
+        position += len(block)
+
+    return position
+
+
+def csv_row_chunks(
+    csv_path: Path, chunk_bytes: int = CHUNK_BYTES
+) -> tuple[bytes, tuple[tuple[int, int], ...]]:
+    """
+    The header row, and byte ranges covering the rest of the file
+    that each start and end on a row boundary
+    """
+    size = csv_path.stat().st_size
+
+    with open(csv_path, "rb") as f:
+        header_end = _row_end_after(f, 0, 0)
+        f.seek(0)
+        header = f.read(header_end)
+
+        starts = [header_end]
+        while starts[-1] < size:
+            starts.append(
+                _row_end_after(
+                    f, starts[-1], starts[-1] + chunk_bytes - 1
+                )
+            )
+
+    return header, tuple(zip(starts, starts[1:]))
+
+
+def decode_csv_bytes(data: bytes) -> io.TextIOWrapper:
+    """Same encoding and newline handling as `open(csv_path)`"""
+    return io.TextIOWrapper(io.BytesIO(data))
+
+
+def _iter_chunk_value_paths(
+    plan: CSVColumnPlan, csv_path: Path, start: int, end: int
+) -> Iterator[tuple[ValuePaths, ValuePaths]]:
+    with open(csv_path, "rb") as f:
+        f.seek(start)
+        data = f.read(end - start)
+
+    for row in csv.reader(decode_csv_bytes(data)):
+        # Same as DictReader
+        if not row:
+            continue
+
+        yield plan.value_paths(row)
+
+
+def _relation_from_chunk[S, T](
+    sop_s: SumProductNode[S],
+    sop_t: SumProductNode[T],
+    plan: CSVColumnPlan,
+    csv_path: Path,
+    start: int,
+    end: int,
+    mode: IngestMode,
+) -> ParallelTriple[S, T]:
+    return parallel_relation_from_value_paths(
+        sop_s,
+        sop_t,
+        _iter_chunk_value_paths(plan, csv_path, start, end),
+        mode,
+    )
+
+
+def parallel_relation_from_csv_in_processes[S, T](
+    s: type[S],
+    t: type[T],
+    csv_path: Path,
+    max_workers: int | None = None,
+    chunk_bytes: int = CHUNK_BYTES,
+    mode: IngestMode = "per_row",
+) -> ParallelTriple[S, T]:
+    """
+    Same as `parallel_relation_from_csv`, but with the rows split
+    into chunks of about `chunk_bytes`, each ingested in its own
+    process
+
+    The chunks' relations are put back together in file order, and
+    their value-augmented SOPs merged
+    """
+    sop_s = sop_from_type(s)
+    sop_t = sop_from_type(t)
+
+    header, chunks = csv_row_chunks(csv_path, chunk_bytes)
+    # Fail on bad columns before starting any processes
+    plan = compile_csv_header(
+        next(csv.reader(decode_csv_bytes(header)), list[str]()),
+        sop_s,
+        sop_t,
+    )
+
+    if len(chunks) <= 1:
+        start, end = chunks[0] if chunks else (len(header),) * 2
+        return _relation_from_chunk(
+            sop_s, sop_t, plan, csv_path, start, end, mode
+        )
+
+    with ProcessPoolExecutor(
+        min(max_workers or os.cpu_count() or 1, len(chunks))
+    ) as executor:
+        futures = tuple(
+            executor.submit(
+                _relation_from_chunk,
+                sop_s,
+                sop_t,
+                plan,
+                csv_path,
+                start,
+                end,
+                mode,
+            )
+            for start, end in chunks
+        )
+        first, *rest = (future.result() for future in futures)
+
+    return ParallelTriple(
+        ParallelRelation(
+            tuple(
+                child
+                for triple in (first, *rest)
+                for child in triple.relation.children
+            )
+        ),
+        source=first.source.merge(
+            *(triple.source for triple in rest)
+        ),
+        target=first.target.merge(
+            *(triple.target for triple in rest)
+        ),
+    )
@@ -0,0 +1,45 @@
+from __future__ import annotations
+from dataclasses import dataclass
+from typing import Generic, Iterable, TypeVar
+
+T = TypeVar("T")
+
+
+@dataclass(frozen=True, slots=True)
+class Env(Generic[T]):
+    """
+    What de Bruijn indices point to: the first `depth` of `items`,
+    innermost last, so looking one up is just indexing
+
+    Pushing shares `items`, cutting off whatever was pushed after
+    `depth` before. So an env is only good until something gets
+    pushed onto one of its ancestors again, which going depth first
+    never looks back at
+    """
+
+    items: list[T]
+    depth: int
+
+    def __getitem__(self, index: int) -> T:
+        """The de Bruijn index, 0 being the innermost"""
+        assert 0 <= index < self.depth
+        return self.items[self.depth - 1 - index]
+
+    def __len__(self) -> int:
+        return self.depth
+
+
+def push[T](env: Env[T] | None, item: T) -> Env[T]:
+    if env is None:
+        return Env([item], 1)
+
+    items = env.items
+    del items[env.depth :]
+    items.append(item)
+    return Env(items, env.depth + 1)
+
+
+def to_env[T](it: Iterable[T]) -> Env[T] | None:
+    """Outermost first"""
+    items = list(it)
+    return Env(items, len(items)) if items else None
@@ -0,0 +1,38 @@
+from typing import Callable, Iterator, Sequence
+
+
+def fold[Item, State, Result](
+    root: Item,
+    expand: Callable[[Item], tuple[State, Sequence[Item]]],
+    combine: Callable[[State, list[Result]], Result],
+) -> Result:
+    """
+    Bottom up over a tree, with a stack instead of recursion so
+    deep SOPs don't hit the recursion limit
+
+    `expand` is what a recursive function would do before
+    recursing, so gives whatever it needs to keep hold of and the
+    children to recurse into. `combine` gets that back with the
+    results for those children, in order
+    """
+    state, children = expand(root)
+    stack: list[tuple[State, Iterator[Item], list[Result]]] = [
+        (state, iter(children), [])
+    ]
+    while True:
+        state, to_expand, results = stack[-1]
+        for child in to_expand:
+            child_state, child_children = expand(child)
+            if child_children:
+                stack.append(
+                    (child_state, iter(child_children), [])
+                )
+                break
+            # Leaves don't need to go on the stack
+            results.append(combine(child_state, []))
+        else:
+            stack.pop()
+            result = combine(state, results)
+            if not stack:
+                return result
+            stack[-1][2].append(result)
@@ -1,4 +1,5 @@
 from pathlib import Path
+from threading import Lock
 import time
 from typing import Any, MutableMapping, TypeVar, cast
 from flask import Flask, g, Response, session
@@ -19,12 +20,17 @@ from csv_dataflow.gui.state.triple import (
     TripleState,
 )
 from csv_dataflow.relation.triple import (
+    ParallelTriple,
     Triple,
     relation_to_triple,
 )
 from examples.ex1.types import A, B
 
-from ..csv import parallel_relation_from_csv
+from ..csv.cache import RelationCache
+from ..csv.incremental import (
+    IncrementalCSVRelation,
+    incremental_relation_from_csv,
+)
 from ..relation import RelationPath
 
 typed_session = cast(MutableMapping[str, bytes], session)
@@ -39,6 +45,29 @@ SESSION_CACHELIB = FileSystemCache(
 app.config.from_object(__name__)
 Session(app)
 
+RELATION_CACHE = RelationCache(Path(".relation_cache"))
+
+_csv_relations: dict[
+    tuple[Path, type[Any], type[Any]],
+    IncrementalCSVRelation[Any, Any],
+] = {}
+_csv_relations_lock = Lock()
+
+
+def csv_relation[S, T](
+    s: type[S], t: type[T], csv_path: Path
+) -> ParallelTriple[S, T]:
+    """Picks up edits to the CSV without restarting"""
+    key = (csv_path, s, t)
+    with _csv_relations_lock:
+        if key not in _csv_relations:
+            _csv_relations[key] = incremental_relation_from_csv(
+                s, t, csv_path, RELATION_CACHE
+            )
+        incremental = _csv_relations[key]
+    # Refreshing has its own lock, so other CSVs don't wait on it
+    return cast(ParallelTriple[S, T], incremental.triple)
+
 
 @app.before_request
 def start_timer():
@@ -103,8 +132,10 @@ def root() -> str:
 def example_1_name_to_code() -> str:
     return relation_page(
         "ex1-name-to-code",
-        parallel_relation_from_csv(
-            A, B, Path("examples/ex1/a_name_to_b_code.csv")
+        csv_relation(
+            A,
+            B,
+            Path("examples/ex1/a_name_to_b_code.csv"),
         ),
     )
 
@@ -113,8 +144,10 @@ def example_1_name_to_code() -> str:
 def example_1_name_to_option() -> str:
     return relation_page(
         "ex1-name-to-option",
-        parallel_relation_from_csv(
-            A, B, Path("examples/ex1/a_name_to_b_option.csv")
+        csv_relation(
+            A,
+            B,
+            Path("examples/ex1/a_name_to_b_option.csv"),
         ),
     )
 
@@ -150,9 +183,9 @@ def netcdf_to_grib() -> str:
 
     return relation_page(
         "netcdf-to-grib", 
-        parallel_relation_from_csv(
+        csv_relation(
             NetCDF, GRIB, 
-            Path("examples/netcdf_to_grib/mapping.csv")
+            Path("examples/netcdf_to_grib/mapping.csv"),
         )
     )
 
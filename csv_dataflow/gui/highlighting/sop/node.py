@@ -44,10 +44,9 @@ def highlighting_from_node_mouseover[S, T, N](
             replace(context.path, sop_path=path): {
                 "HasRelatedChildren"
             }
-            for path, data in subtree_in_relation.iter_all_paths_with_data(
-                context.path.sop_path
+            for path, _ in subtree_in_relation.iter_all_paths_with_data(
+                context.path.sop_path, truthy_only=True
             )
-            if data
         }
     )
 
@@ -41,7 +41,10 @@ def relation_html(
                     triple = relation_to_triple(
                         relation, source, target
                     )
-            triple_full = triple.map_data(lambda _: True)
+            # Only rendered, so only worth mapping what gets looked at
+            triple_full = triple.map_data(
+                lambda _: True, lazy=True
+            )
             sop_htmls = (
                 sop_html(
                     page_name, triple_full, "Source", source
@@ -28,20 +28,21 @@ def set_session_point_path_expanded(
 
     # Expand / collapse the path
     expanded = sop.expanded
-    expanded = expanded.replace_data_at(path, yes)
+    collapsed_children: dict[
+        SumProductPath[Any], SumProductNode[Any, bool]
+    ] = {}
     if yes:
         # Expand recursion NOTE no longer understand
         for child in expanded.at(path).children:
             child_path = (*path, child)
-            expanded = expanded.replace_at(
-                child_path,
-                expanded.at(child_path).map_data(
-                    lambda _: False
-                ),
-            )
+            collapsed_children[child_path] = expanded.at(
+                child_path
+            ).map_data(lambda _: False)
 
     # Save and recalculate visible stuff
-    sop.expanded = expanded
+    sop.expanded = expanded.replace_many(
+        collapsed_children, {path: yes}
+    )
     state.recalculate_visible()
 
     match point:
@@ -19,10 +19,12 @@ class SOPUserState[T]:
     @classmethod
     def from_sop(cls, sop: SumProductNode[T]) -> SOPUserState[T]:
         # replace is expanding only the top level, all other
-        # levels collapsed by default
+        # levels collapsed by default. Not a lazy map, the session
+        # pickles the whole thing every time it's saved anyway
+        collapsed = sop.map_data(lambda _: False)
         return cls(
-            replace(sop.map_data(lambda _: False), data=True),
-            replace(sop.map_data(lambda _: False), data=True),
+            replace(collapsed, data=True),
+            replace(collapsed, data=True),
         )
 
 
@@ -3,6 +3,7 @@ from typing import TypeVar
 from frozendict import frozendict
 
 from ..sop import DeBruijn, SumOrProduct, SumProductChild, SumProductNode
+from ..sop.lazy import unforced_children
 
 S = TypeVar("S")
 T = TypeVar("T")
@@ -12,6 +13,20 @@ def combine_same(a: T, b: T) -> T:
     return a
 
 
+def _nothing_selected_under(
+    selected: SumProductNode[T, bool] | None,
+) -> bool:
+    """Only if it can tell without looking at every node"""
+    if selected is None:
+        return True
+    children = unforced_children(selected)
+    return (
+        not selected.data
+        and children is not None
+        and not children.data
+    )
+
+
 def compute_visible_sop(
     selected: SumProductNode[T, bool] | None,
     expanded: SumProductNode[T, bool] | None,
@@ -20,6 +35,10 @@ def compute_visible_sop(
     sop: SumOrProduct
     if selected is None and expanded is None:
         return None
+    elif not parent_expanded and _nothing_selected_under(selected):
+        # Would come out as None anyway, without having to look
+        # through lazy children
+        return None
     elif selected and expanded:
         child_paths = map(combine_same, selected.children, expanded.children)
         sop = combine_same(selected.sop, expanded.sop)
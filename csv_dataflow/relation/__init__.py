@@ -1,4 +1,5 @@
 from __future__ import annotations
+from collections import Counter
 from dataclasses import dataclass, replace
 from functools import cache
 from itertools import chain
@@ -41,7 +42,7 @@ RelationPathElement = StageIndex | ParallelChildIndex
 RelationPrefix = tuple[RelationPathElement, ...]
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class RelationPath[S, T]:
     point: Literal["Source", "Target"] | None
     sop_path: SumProductPath[Any]
@@ -133,23 +134,32 @@ class RelationPath[S, T]:
         )
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class LeafRelation[S, T, Data]:
     source: SumProductNode[S, Data] | None
     target: SumProductNode[T, Data] | None
     data: Data = cast(Data, None)
 
     def map_data[OtherData](
-        self, f: Callable[[Data], OtherData]
+        self, f: Callable[[Data], OtherData], lazy: bool = False
     ) -> BasicRelation[S, T, OtherData]:
+        """`lazy` is for the SOPs, see `SumProductNode.map_data`"""
         return BasicRelation(
-            self.source.map_data(f) if self.source else None,
-            self.target.map_data(f) if self.target else None,
+            (
+                self.source.map_data(f, lazy)
+                if self.source
+                else None
+            ),
+            (
+                self.target.map_data(f, lazy)
+                if self.target
+                else None
+            ),
             f(self.data),
         )
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class BasicRelation[S, T, Data = None](LeafRelation[S, T, Data]):
     """
     This is a binary relation, between all path groupings that
@@ -178,7 +188,7 @@ class BasicRelation[S, T, Data = None](LeafRelation[S, T, Data]):
         return at(self, path)
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class Copy[S, T, Data = None](LeafRelation[S, T, Data]):
     """
     Individually relates every leaf (and closure under "*" of
@@ -207,7 +217,7 @@ class Copy[S, T, Data = None](LeafRelation[S, T, Data]):
         return at(self, path)
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class Between[S, T]:
     source: SumProductPath[S]
     target: SumProductPath[T]
@@ -252,14 +262,35 @@ class ParallelRelation[S, T, Data = None]:
     ) -> SumProductNode[Any, Data]:
         return at(self, path)
 
+    def counted_children(
+        self,
+    ) -> tuple[
+        tuple[
+            Relation[Any, Any, Data] | DeBruijn,
+            Between[S, T],
+            int,
+        ],
+        ...,
+    ]:
+        """
+        Children with duplicates collapsed, and how many times each
+        one turned up, in the order they first did
+        """
+        return tuple(
+            (child, between, count)
+            for (child, between), count in Counter(
+                self.children
+            ).items()
+        )
+
     def map_data[OtherData](
-        self, f: Callable[[Data], OtherData]
+        self, f: Callable[[Data], OtherData], lazy: bool = False
     ) -> ParallelRelation[S, T, OtherData]:
         return ParallelRelation(
             tuple(
                 (
                     (
-                        child.map_data(f)
+                        child.map_data(f, lazy)
                         if not isinstance(child, DeBruijn)
                         else child
                     ),
@@ -288,13 +319,12 @@ class SeriesRelation[S, T, Data = None]:
         return at(self, path)
 
     def map_data[OtherData](
-        self, f: Callable[[Data], OtherData]
+        self, f: Callable[[Data], OtherData], lazy: bool = False
     ) -> SeriesRelation[S, T, OtherData]: ...
 
 
 from csv_dataflow.relation.at import at
 
-
 # FIXME Then go straight to "what does this partially specified
 #       domain / range member go to / come from"
 #       Then go to "is it a function"
@@ -1,5 +1,5 @@
 from typing import Any, TypeVar
-from csv_dataflow.cons import Cons, ConsList, at_index
+from csv_dataflow.env import Env, push
 from csv_dataflow.relation import (
     BasicRelation,
     Between,
@@ -11,6 +11,7 @@ from csv_dataflow.relation.recursion import (
     assert_subpaths_if_recursive,
 )
 from csv_dataflow.sop import SumProductNode, SumProductPath
+from csv_dataflow.sop.clip import ClipContext
 
 S = TypeVar("S")
 T = TypeVar("T")
@@ -18,26 +19,33 @@ T = TypeVar("T")
 
 def clip_relation(
     relation: Relation[S, T],
-    source_clip: SumProductNode[S, Any],
-    target_clip: SumProductNode[T, Any],
+    source_clip: SumProductNode[S, Any] | ClipContext[S],
+    target_clip: SumProductNode[T, Any] | ClipContext[T],
     source_prefix: SumProductPath[S] = (),
     target_prefix: SumProductPath[T] = (),
-    prev_stack: ConsList[Relation[S, T]] = None,
+    prev_stack: Env[Relation[S, T]] | None = None,
 ) -> Relation[S, T]:
+    """
+    Pass in `ClipContext`s to share the clipping between calls
+    against the same clip SOPs
+    """
+    if not isinstance(source_clip, ClipContext):
+        source_clip = ClipContext(source_clip)
+    if not isinstance(target_clip, ClipContext):
+        target_clip = ClipContext(target_clip)
+
     clipped_source_prefix = source_clip.clip_path(source_prefix)
     clipped_target_prefix = target_clip.clip_path(target_prefix)
     match relation:
         case BasicRelation(source, target):
             assert source and target
             if clipped_source_prefix == source_prefix:
-                source_clip = source_clip.at(source_prefix)
-                source = source.clip(source_clip)
+                source = source_clip.clip(source, source_prefix)
             else:
                 source = source_clip.at(clipped_source_prefix)
 
             if clipped_target_prefix == target_prefix:
-                target_clip = target_clip.at(target_prefix)
-                target = target.clip(target_clip)
+                target = target_clip.clip(target, target_prefix)
             else:
                 target = target_clip.at(clipped_target_prefix)
 
@@ -54,7 +62,7 @@ def clip_relation(
                     target_clip.at(clipped_target_prefix),
                 )
 
-            stack = Cons(relation, prev_stack)
+            stack = push(prev_stack, relation)
             children = tuple(
                 (
                     (
@@ -62,7 +70,7 @@ def clip_relation(
                             (
                                 child
                                 if not isinstance(child, int)
-                                else at_index(stack, child)
+                                else stack[child]
                             ),
                             source_clip,
                             target_clip,
@@ -0,0 +1,158 @@
+from dataclasses import dataclass, field, replace
+from typing import Any, Hashable
+
+from frozendict import frozendict
+
+from csv_dataflow.fold import fold
+from csv_dataflow.relation import (
+    BasicRelation,
+    Between,
+    ParallelRelation,
+)
+from csv_dataflow.sop import SumProductChild, SumProductNode
+from csv_dataflow.sop.intern import InternKey, intern_key
+
+
+@dataclass
+class RelationInterner:
+    """
+    Hash-consing table, so equal SOP subtrees and relations passed
+    through it come out as the same object
+
+    Equal here includes the children being in the same order, as
+    that's the order they get shown in. Apart from the memory, this
+    makes comparing them cheap later, since equality checks on
+    tuples and dataclasses try identity first. Data has to be
+    hashable
+    """
+
+    nodes: dict[InternKey, SumProductNode[Any, Any]] = field(
+        default_factory=dict[InternKey, SumProductNode[Any, Any]]
+    )
+    relations: dict[
+        tuple[int, int, type[object], Hashable],
+        BasicRelation[Any, Any],
+    ] = field(
+        default_factory=dict[
+            tuple[int, int, type[object], Hashable],
+            BasicRelation[Any, Any],
+        ]
+    )
+    """By the ids of the interned source and target"""
+    _interned: dict[int, SumProductNode[Any, Any]] = field(
+        default_factory=dict[int, SumProductNode[Any, Any]],
+        repr=False,
+    )
+    """
+    What's in `nodes` by id, so passing one back in doesn't walk
+    it again. They're kept alive by `nodes`, so the ids stay theirs
+    """
+
+    def node[T, Data](
+        self, node: SumProductNode[T, Data]
+    ) -> SumProductNode[T, Data]:
+        nodes = self.nodes
+        interned_by_id = self._interned
+
+        def expand(
+            node: SumProductNode[Any, Data],
+        ) -> tuple[
+            SumProductNode[Any, Data],
+            list[SumProductNode[Any, Data]],
+        ]:
+            if id(node) in interned_by_id:
+                return node, []
+            return node, [
+                child
+                for child in node.children.values()
+                if not isinstance(child, int)
+            ]
+
+        def combine(
+            node: SumProductNode[Any, Data],
+            interned: list[SumProductNode[Any, Data]],
+        ) -> SumProductNode[Any, Data]:
+            if id(node) in interned_by_id:
+                return node
+
+            interned_children = iter(interned)
+            children: dict[str, SumProductChild[Data]] = {
+                name: (
+                    child
+                    if isinstance(child, int)
+                    else next(interned_children)
+                )
+                for name, child in node.children.items()
+            }
+            key = intern_key(node.sop, children, node.data)
+            existing = nodes.get(key)
+            if existing is not None:
+                return existing
+
+            if any(
+                children[name] is not child
+                for name, child in node.children.items()
+            ):
+                node = replace(
+                    node, children=frozendict(children)
+                )
+            nodes[key] = node
+            interned_by_id[id(node)] = node
+            return node
+
+        return fold(node, expand, combine)
+
+    def relation[S, T](
+        self, relation: BasicRelation[S, T]
+    ) -> BasicRelation[S, T]:
+        source = (
+            None
+            if relation.source is None
+            else self.node(relation.source)
+        )
+        target = (
+            None
+            if relation.target is None
+            else self.node(relation.target)
+        )
+        key = (
+            id(source),
+            id(target),
+            type(relation.data),
+            relation.data,
+        )
+        interned = self.relations.get(key)
+        if interned is None:
+            if (
+                source is not relation.source
+                or target is not relation.target
+            ):
+                relation = BasicRelation(
+                    source, target, relation.data
+                )
+            interned = self.relations[key] = relation
+        return interned
+
+    def parallel_relation[S, T](
+        self, relation: ParallelRelation[S, T]
+    ) -> ParallelRelation[S, T]:
+        """Interns its `BasicRelation` children"""
+        between = Between[S, T]((), ())
+        return ParallelRelation(
+            tuple(
+                (
+                    (
+                        self.relation(child)
+                        if isinstance(child, BasicRelation)
+                        else child
+                    ),
+                    (
+                        between
+                        if child_between == between
+                        else child_between
+                    ),
+                )
+                for child, child_between in relation.children
+            ),
+            relation.data,
+        )
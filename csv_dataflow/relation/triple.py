@@ -39,15 +39,15 @@ class BasicTriple[S, T, Data = None](
     relation: BasicRelation[S, T, Data]
 
     def map_data[OtherData](
-        self, f: Callable[[Data], OtherData]
+        self, f: Callable[[Data], OtherData], lazy: bool = False
     ) -> BasicTriple[S, T, OtherData]:
         return cast(
             BasicTriple[S, T, OtherData],
             replace(
                 self,
-                relation=self.relation.map_data(f),
-                source=self.source.map_data(f),
-                target=self.target.map_data(f),
+                relation=self.relation.map_data(f, lazy),
+                source=self.source.map_data(f, lazy),
+                target=self.target.map_data(f, lazy),
             ),
         )
 
@@ -59,15 +59,15 @@ class CopyTriple[S, T, Data = None](
     relation: Copy[S, T, Data]
 
     def map_data[OtherData](
-        self, f: Callable[[Data], OtherData]
+        self, f: Callable[[Data], OtherData], lazy: bool = False
     ) -> CopyTriple[S, T, OtherData]:
         return cast(
             CopyTriple[S, T, OtherData],
             replace(
                 self,
-                relation=self.relation.map_data(f),
-                source=self.source.map_data(f),
-                target=self.target.map_data(f),
+                relation=self.relation.map_data(f, lazy),
+                source=self.source.map_data(f, lazy),
+                target=self.target.map_data(f, lazy),
             ),
         )
 
@@ -99,15 +99,15 @@ class ParallelTriple[S, T, Data = None](
         )
 
     def map_data[OtherData](
-        self, f: Callable[[Data], OtherData]
+        self, f: Callable[[Data], OtherData], lazy: bool = False
     ) -> ParallelTriple[S, T, OtherData]:
         return cast(
             ParallelTriple[S, T, OtherData],
             replace(
                 self,
-                relation=self.relation.map_data(f),
-                source=self.source.map_data(f),
-                target=self.target.map_data(f),
+                relation=self.relation.map_data(f, lazy),
+                source=self.source.map_data(f, lazy),
+                target=self.target.map_data(f, lazy),
             ),
         )
 
@@ -119,15 +119,15 @@ class SeriesTriple[S, T, Data = None](
     relation: SeriesRelation[S, T, Data]
 
     def map_data[OtherData](
-        self, f: Callable[[Data], OtherData]
+        self, f: Callable[[Data], OtherData], lazy: bool = False
     ) -> SeriesTriple[S, T, OtherData]:
         return cast(
             SeriesTriple[S, T, OtherData],
             replace(
                 self,
-                relation=self.relation.map_data(f),
-                source=self.source.map_data(f),
-                target=self.target.map_data(f),
+                relation=self.relation.map_data(f, lazy),
+                source=self.source.map_data(f, lazy),
+                target=self.target.map_data(f, lazy),
             ),
         )
 
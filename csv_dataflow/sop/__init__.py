@@ -1,5 +1,6 @@
 from __future__ import annotations
-from dataclasses import dataclass, replace
+from dataclasses import dataclass, field, replace
+from itertools import chain
 from typing import (
     Any,
     Callable,
@@ -15,7 +16,8 @@ from typing import (
 from frozendict import frozendict
 
 
-from ..cons import ConsList
+from ..env import Env
+from ..fold import fold
 
 SumOrProduct = Literal["+", "*"]
 
@@ -34,8 +36,15 @@ type SumProductChild[Data = None] = SumProductNode[
     Any, Data
 ] | DeBruijn
 
+type _MapState[Data, OtherData] = tuple[
+    SumProductNode[Any, Data],
+    OtherData,
+    LazyChildren[OtherData] | None,
+]
+"""The node, its new data, and its new children if still lazy"""
 
-@dataclass(frozen=True)
+
+@dataclass(frozen=True, eq=False, slots=True, weakref_slot=True)
 class SumProductNode(Generic[T, Data]):
     """
     Because of Python being Python, children of a Sum will all
@@ -51,15 +60,113 @@ class SumProductNode(Generic[T, Data]):
     children: Mapping[str, SumProductChild[Data]]
     """The key is the path member"""
     data: Data = cast(Data, None)
+    _hash: int | None = field(
+        default=None, init=False, repr=False
+    )
+    _path_index: PathIndex[T, Data] | None = field(
+        default=None, init=False, repr=False
+    )
+    _recursion_flags: tuple[bool, int] | None = field(
+        default=None, init=False, repr=False
+    )
+
+    def __eq__(self, other: object) -> bool:
+        if self is other:
+            return True
+        if other.__class__ is not self.__class__:
+            return NotImplemented
+
+        # A stack rather than letting the children compare
+        # themselves, which would recurse
+        to_compare: list[
+            tuple[
+                SumProductNode[Any, Any],
+                SumProductNode[Any, Any],
+            ]
+        ] = [(self, cast(SumProductNode[Any, Any], other))]
+        while to_compare:
+            node, other = to_compare.pop()
+            if node is other:
+                continue
+            # Both hashed already, so this might save a full walk
+            if (
+                node._hash is not None
+                and other._hash is not None
+                and node._hash != other._hash
+            ):
+                return False
+
+            if (
+                node.sop != other.sop
+                or node.data != other.data
+                or node.children.keys() != other.children.keys()
+            ):
+                return False
+
+            for path, child in node.children.items():
+                other_child = other.children[path]
+                if isinstance(
+                    child, SumProductNode
+                ) and isinstance(other_child, SumProductNode):
+                    to_compare.append((child, other_child))
+                elif child != other_child:
+                    return False
+
+        return True
+
+    def __hash__(self) -> int:
+        """Worked out once, then kept on the node"""
+        if self._hash is None:
+            # Children first, so hashing each node only looks at
+            # hashes already worked out rather than recursing
+            to_hash: list[SumProductNode[Any, Any]] = [self]
+            unhashed: list[SumProductNode[Any, Any]] = []
+            while to_hash:
+                node = to_hash.pop()
+                if node._hash is None:
+                    unhashed.append(node)
+                    to_hash.extend(
+                        child
+                        for child in node.children.values()
+                        if not isinstance(child, int)
+                    )
+            for node in reversed(unhashed):
+                if node._hash is None:
+                    object.__setattr__(
+                        node,
+                        "_hash",
+                        hash(
+                            (node.sop, node.children, node.data)
+                        ),
+                    )
+        return cast(int, self._hash)
+
+    def __getstate__(self) -> tuple[Any, ...]:
+        # Not the hash, string hashes are different in every process,
+        # or the path index and recursion flags
+        return self.sop, self.children, self.data
+
+    def __setstate__(self, state: tuple[Any, ...]) -> None:
+        for name, value in zip(
+            ("sop", "children", "data"), state
+        ):
+            object.__setattr__(self, name, value)
+        object.__setattr__(self, "_hash", None)
+        object.__setattr__(self, "_path_index", None)
+        object.__setattr__(self, "_recursion_flags", None)
 
     @staticmethod
     def from_type(t: type[T]) -> SumProductNode[T]:
         return sop_from_type(t)
 
+    @staticmethod
+    def lazy_from_type(t: type[T]) -> SumProductNode[T]:
+        return lazy_sop_from_type(t)
+
     def at(
         self,
         path: SumProductPath[T],
-        prev_stack: ConsList[SumProductNode[Any, Data]] = None,
+        prev_stack: Env[SumProductNode[Any, Data]] | None = None,
     ) -> SumProductNode[Any, Data]:
         return at(self, path, prev_stack)
 
@@ -67,7 +174,7 @@ class SumProductNode(Generic[T, Data]):
         self,
         path: SumProductPath[T],
         node: SumProductNode[Any, Data],
-        prev_stack: ConsList[SumProductNode[Any, Data]] = None,
+        prev_stack: Env[SumProductNode[Any, Data]] | None = None,
     ) -> SumProductNode[T, Data]:
         return replace_at(self, path, node, prev_stack)
 
@@ -76,10 +183,21 @@ class SumProductNode(Generic[T, Data]):
     ) -> SumProductNode[T, Data]:
         return replace_data_at(self, path, data)
 
+    def replace_many(
+        self,
+        nodes: Mapping[
+            SumProductPath[T], SumProductNode[Any, Data]
+        ] = frozendict[Any, Any](),
+        data: Mapping[SumProductPath[T], Data] = frozendict[
+            Any, Any
+        ](),
+    ) -> SumProductNode[T, Data]:
+        return replace_many(self, nodes, data)
+
     def clip(
         self,
         clip_sop: SumProductNode[T, Any],
-        prev_stack: ConsList[SumProductNode[Any, Data]] = None,
+        prev_stack: Env[SumProductNode[Any, Data]] | None = None,
     ) -> SumProductNode[T, Data]:
         return clip(self, clip_sop, prev_stack)
 
@@ -87,7 +205,7 @@ class SumProductNode(Generic[T, Data]):
         self,
         path: SumProductPath[T],
         path_prefix: SumProductPath[T] = (),
-        prev_stack: ConsList[SumProductNode[Any, Data]] = None,
+        prev_stack: Env[SumProductNode[Any, Data]] | None = None,
     ) -> SumProductPath[T]:
         return clip_path(self, path, path_prefix, prev_stack)
 
@@ -102,44 +220,96 @@ class SumProductNode(Generic[T, Data]):
         return iterate_every(self, prefix)
 
     def iter_all_paths_with_data(
-        self, prefix: SumProductPath[T] = ()
+        self,
+        prefix: SumProductPath[T] = (),
+        truthy_only: bool = False,
     ) -> Iterator[tuple[SumProductPath[T], Data]]:
-        return iterate_every_with_data(self, prefix)
+        return iterate_every_with_data(self, prefix, truthy_only)
 
     def add_values_at_paths(
-        self, paths: Collection[SumProductPath[T]]
+        self, paths: Collection[SumProductPath[T]] | PathTrie
     ) -> SumProductNode[T, Data]:
         added = add_values_at_paths(self, paths)
         assert not isinstance(added, DeBruijn)
         return added
 
     def filter_to_paths(
-        self, paths: Collection[SumProductPath[T]]
+        self, paths: Collection[SumProductPath[T]] | PathTrie
     ) -> SumProductNode[T, Data] | None:
         return filter_to_paths(self, paths)
 
     def map_data(
-        self, f: Callable[[Data], OtherData]
+        self, f: Callable[[Data], OtherData], lazy: bool = False
     ) -> SumProductNode[T, OtherData]:
-        return cast(
-            SumProductNode[T, OtherData],
-            replace(
-                self,
-                data=f(self.data),
-                children=frozendict[
-                    str, SumProductChild[OtherData]
-                ](
-                    {
-                        path: (
-                            child.map_data(f)
-                            if not isinstance(child, int)
-                            else child
-                        )
-                        for path, child in self.children.items()
-                    }
+        """
+        Lazily, each node only gets mapped when it's first got to,
+        see `materialized`
+        """
+        if lazy:
+            return mapped_view(self, f)
+
+        def expand(
+            node: SumProductNode[Any, Data],
+        ) -> tuple[
+            _MapState[Data, OtherData],
+            tuple[SumProductNode[Any, Data], ...],
+        ]:
+            lazy_children = unforced_children(node)
+            if lazy_children is not None:
+                # All the same data under it, so it can stay lazy
+                return (
+                    node,
+                    f(node.data),
+                    lazy_children.with_data(
+                        f(lazy_children.data)
+                    ),
+                ), ()
+
+            return (node, f(node.data), None), tuple(
+                child
+                for child in node.children.values()
+                if not isinstance(child, int)
+            )
+
+        def combine(
+            state: _MapState[Data, OtherData],
+            mapped: list[SumProductNode[Any, OtherData]],
+        ) -> SumProductNode[Any, OtherData]:
+            node, data, lazy_children = state
+            if lazy_children is not None:
+                return cast(
+                    SumProductNode[Any, OtherData],
+                    replace(
+                        node, data=data, children=lazy_children
+                    ),
+                )
+
+            mapped_children = iter(mapped)
+            return cast(
+                SumProductNode[Any, OtherData],
+                replace(
+                    node,
+                    data=data,
+                    children=frozendict[
+                        str, SumProductChild[OtherData]
+                    ](
+                        {
+                            path: (
+                                child
+                                if isinstance(child, int)
+                                else next(mapped_children)
+                            )
+                            for path, child in node.children.items()
+                        }
+                    ),
                 ),
-            ),
-        )
+            )
+
+        return fold(self, expand, combine)
+
+    def materialized(self) -> SumProductNode[T, Data]:
+        """With any lazy mapping all done"""
+        return self.map_data(lambda data: data)
 
     def merge(
         self, *sops: SumProductNode[T, Data]
@@ -158,6 +328,99 @@ class SumProductNode(Generic[T, Data]):
         """Has no content, just infinite loops"""
         return is_empty_recursion(self)
 
+    def recursion_flags(self) -> tuple[bool, int]:
+        """
+        `only_has_de_bruijn_indices`, and if so
+        `max_de_bruijn_index_relative_to_current_node` (otherwise
+        0), for `is_empty_recursion`
+
+        Worked out once from the children's then kept on the node.
+        That stops at the first child with any content, as then
+        this has some too
+        """
+        if self._recursion_flags is not None:
+            return self._recursion_flags
+
+        # A stack rather than recursing, with the highest index
+        # seen so far in each node
+        stack: list[
+            tuple[
+                SumProductNode[Any, Any],
+                Iterator[SumProductChild[Any]],
+                int | None,
+                SumProductNode[Any, Any] | None,
+            ]
+        ] = [(self, iter(self.children.values()), None, None)]
+        while stack:
+            node, children, max_index, pending = stack[-1]
+            flags: tuple[bool, int] | None = None
+            for child in chain(
+                () if pending is None else (pending,), children
+            ):
+                if isinstance(child, int):
+                    index = child
+                else:
+                    child_flags = child._recursion_flags
+                    if child_flags is None:
+                        # Back to this child once it's worked out
+                        stack[-1] = (
+                            node,
+                            children,
+                            max_index,
+                            child,
+                        )
+                        stack.append(
+                            (
+                                child,
+                                iter(child.children.values()),
+                                None,
+                                None,
+                            )
+                        )
+                        break
+                    only_de_bruijn, index = child_flags
+                    if not only_de_bruijn:
+                        flags = False, 0
+                        break
+                    index -= 1
+                max_index = (
+                    index
+                    if max_index is None
+                    else max(max_index, index)
+                )
+            else:
+                # No children at all is a terminal node, which is
+                # data
+                flags = (
+                    (False, 0)
+                    if max_index is None
+                    else (True, max_index)
+                )
+
+            if flags is not None:
+                object.__setattr__(
+                    node, "_recursion_flags", flags
+                )
+                stack.pop()
+
+        return cast(tuple[bool, int], self._recursion_flags)
+
+    def path_index(self) -> PathIndex[T, Data]:
+        """Made the first time it's needed, then kept on the node"""
+        if self._path_index is None:
+            index = PathIndex[T, Data]()
+            object.__setattr__(self, "_path_index", index)
+            return index
+        return self._path_index
+
+    def interned(self) -> SumProductNode[T, Data]:
+        """Equal subtrees made into the same objects"""
+        return intern_sop(self)
+
+    def arena(self) -> SOPArena[T, Data]:
+        """Flattened into arrays"""
+        return sop_arena(self)
+
 
 UNIT = SumProductNode[Any](
     "*", frozendict[str, SumProductChild]({})
@@ -167,9 +430,23 @@ VOID = SumProductNode[Any](
 )
 
 # Implementations
-from csv_dataflow.sop.at import at, replace_at, replace_data_at
+from csv_dataflow.sop.arena import SOPArena, sop_arena
+from csv_dataflow.sop.at import (
+    PathIndex,
+    at,
+    replace_at,
+    replace_data_at,
+    replace_many,
+)
 from csv_dataflow.sop.clip import clip, clip_path
 from csv_dataflow.sop.from_type import sop_from_type
+from csv_dataflow.sop.intern import intern_sop
+from csv_dataflow.sop.lazy import (
+    LazyChildren,
+    lazy_sop_from_type,
+    unforced_children,
+)
+from csv_dataflow.sop.mapped import mapped_view
 from csv_dataflow.sop.merge import merge
 from csv_dataflow.sop.paths.add_values import add_values_at_paths
 from csv_dataflow.sop.paths.iterate import (
@@ -178,6 +455,7 @@ from csv_dataflow.sop.paths.iterate import (
     iterate_leaves,
 )
 from csv_dataflow.sop.paths.filter_to import filter_to_paths
+from csv_dataflow.sop.paths.trie import PathTrie
 from csv_dataflow.sop.recursion import (
     is_empty_recursion,
     max_de_bruijn_index_relative_to_current_node,
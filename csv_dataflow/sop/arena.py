@@ -0,0 +1,342 @@
+from __future__ import annotations
+from array import array
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Generic, Iterator, Mapping, TypeVar, cast
+
+from frozendict import frozendict
+
+from csv_dataflow.env import Env, push, to_env
+from csv_dataflow.sop import (
+    SumOrProduct,
+    SumProductChild,
+    SumProductNode,
+    SumProductPath,
+)
+
+T = TypeVar("T")
+Data = TypeVar("Data", default=None)
+
+DE_BRUIJN = ord("#")
+NO_NODE = -1
+
+
+@dataclass(frozen=True, slots=True)
+class SOPArena(Generic[T, Data]):
+    """
+    A SOP flattened into preorder arrays, node 0 being the root.
+    See `SumProductNode.arena`
+
+    A de Bruijn index gets a node of its own, of kind "#", with
+    the index in `de_bruijn`. Like in the tree, it's resolved
+    against the nodes passed on the way down, not looked up ahead
+    of time
+
+    The arrays are all plain machine ints, so pickle as raw bytes.
+    Don't modify them
+    """
+
+    kinds: bytes
+    """"+", "*" or "#" """
+    parents: array[int]
+    first_children: array[int]
+    next_siblings: array[int]
+    names: array[int]
+    """Index in `name_table` of the name the parent has for it"""
+    name_table: tuple[str, ...]
+    de_bruijn: array[int]
+    data: tuple[Data, ...]
+    name_ids: Mapping[str, int] = field(
+        repr=False, compare=False
+    )
+
+    def to_sop(self, index: int = 0) -> SumProductNode[T, Data]:
+        built: dict[int, SumProductChild[Data]] = {}
+        # Children come after their parents
+        for node in reversed(
+            range(index, self.subtree_end(index))
+        ):
+            if self.kinds[node] == DE_BRUIJN:
+                built[node] = self.de_bruijn[node]
+                continue
+
+            built[node] = SumProductNode(
+                cast(SumOrProduct, chr(self.kinds[node])),
+                frozendict[str, SumProductChild[Data]](
+                    {
+                        self.name_table[
+                            self.names[child]
+                        ]: built.pop(child)
+                        for child in self.children(node)
+                    }
+                ),
+                self.data[node],
+            )
+
+        root = built[index]
+        assert not isinstance(root, int)
+        return root
+
+    def __len__(self) -> int:
+        return len(self.kinds)
+
+    def children(self, index: int) -> Iterator[int]:
+        child = self.first_children[index]
+        while child != NO_NODE:
+            yield child
+            child = self.next_siblings[child]
+
+    def child(self, index: int, name: str) -> int | None:
+        """Without following de Bruijn indices"""
+        name_id = self.name_ids.get(name)
+        if name_id is None:
+            return None
+
+        for child in self.children(index):
+            if self.names[child] == name_id:
+                return child
+        return None
+
+    def subtree_end(self, index: int) -> int:
+        """Index just past the last node under `index`"""
+        node = index
+        while node != NO_NODE:
+            if self.next_siblings[node] != NO_NODE:
+                return self.next_siblings[node]
+            node = self.parents[node]
+        return len(self)
+
+    def ancestors(self, index: int) -> Env[int] | None:
+        """The stack of nodes above, as if walked down from the root"""
+        parents: list[int] = []
+        node = self.parents[index]
+        while node != NO_NODE:
+            parents.append(node)
+            node = self.parents[node]
+        return to_env(reversed(parents))
+
+    def _resolve(self, node: int, stack: Env[int]) -> int:
+        if self.kinds[node] == DE_BRUIJN:
+            return stack[self.de_bruijn[node]]
+        return node
+
+    def at(self, path: SumProductPath[T], index: int = 0) -> int:
+        """
+        The index of the node at `path` from `index`, like
+        `SumProductNode.at`
+        """
+        stack = self.ancestors(index)
+        node = index
+        for element in path:
+            stack = push(stack, node)
+            child = self.child(node, element)
+            if child is None:
+                raise KeyError(element)
+            node = self._resolve(child, stack)
+        return node
+
+    def _iter_preorder(
+        self, prefix: SumProductPath[T], index: int
+    ) -> Iterator[tuple[int, SumProductPath[T]]]:
+        """Every node under `index` with its path, de Bruijn too"""
+        # The path to each node above the current one
+        paths: list[tuple[int, SumProductPath[T]]] = []
+        for node in range(index, self.subtree_end(index)):
+            if node == index:
+                path = prefix
+            else:
+                parent = self.parents[node]
+                while paths[-1][0] != parent:
+                    paths.pop()
+                path = (
+                    *paths[-1][1],
+                    self.name_table[self.names[node]],
+                )
+            paths.append((node, path))
+            yield node, path
+
+    def iter_leaf_paths(
+        self, prefix: SumProductPath[T] = (), index: int = 0
+    ) -> Iterator[SumProductPath[T]]:
+        """Same order as `SumProductNode.iter_leaf_paths`"""
+        for node, path in self._iter_preorder(prefix, index):
+            assert (
+                self.kinds[node] != DE_BRUIJN
+            ), "Flat iterating over a recursive type is probably a mistake"
+            if self.first_children[node] == NO_NODE:
+                yield path
+
+    def iter_all_paths_with_data(
+        self,
+        prefix: SumProductPath[T] = (),
+        index: int = 0,
+        truthy_only: bool = False,
+    ) -> Iterator[tuple[SumProductPath[T], Data]]:
+        """
+        Same order as `SumProductNode.iter_all_paths_with_data`,
+        not following de Bruijn indices
+        """
+        to_visit = deque([(index, prefix)])
+        while to_visit:
+            node, path = to_visit.popleft()
+            if self.kinds[node] == DE_BRUIJN:
+                continue
+
+            if self.data[node] or not truthy_only:
+                yield path, self.data[node]
+            to_visit.extend(
+                (
+                    child,
+                    (*path, self.name_table[self.names[child]]),
+                )
+                for child in self.children(node)
+            )
+
+    def clip(
+        self, clip_arena: SOPArena[T, Any], index: int = 0
+    ) -> SOPArena[T, Data]:
+        """
+        `SumProductNode.clip`: only the parts of this that are in
+        `clip_arena`, with de Bruijn indices unrolled where it goes
+        further than them
+        """
+        builder = _ArenaBuilder[T, Data](dict(self.name_ids))
+        to_visit: list[
+            tuple[int, int, int, int, Env[int] | None]
+        ] = [(index, 0, NO_NODE, NO_NODE, self.ancestors(index))]
+        while to_visit:
+            node, clip_node, parent, name, prev_stack = (
+                to_visit.pop()
+            )
+            clipped = builder.add(
+                parent,
+                name,
+                self.kinds[node],
+                NO_NODE,
+                self.data[node],
+            )
+
+            stack = push(prev_stack, node)
+            children: list[
+                tuple[int, int, int, int, Env[int] | None]
+            ] = []
+            for clip_child in clip_arena.children(clip_node):
+                assert (
+                    clip_arena.kinds[clip_child] != DE_BRUIJN
+                ), "Potentially this could make sense but we haven't needed it yet"
+
+                child_name = clip_arena.name_table[
+                    clip_arena.names[clip_child]
+                ]
+                child = self.child(node, child_name)
+                if child is not None:
+                    children.append(
+                        (
+                            self._resolve(child, stack),
+                            clip_child,
+                            clipped,
+                            self.name_ids[child_name],
+                            stack,
+                        )
+                    )
+            to_visit.extend(reversed(children))
+
+        return builder.build()
+
+
+def sop_arena(
+    sop: SumProductNode[T, Data],
+) -> SOPArena[T, Data]:
+    builder = _ArenaBuilder[T, Data]({})
+    to_visit: list[tuple[SumProductChild[Data], int, int]] = [
+        (sop, NO_NODE, NO_NODE)
+    ]
+    while to_visit:
+        node, parent, name = to_visit.pop()
+        if isinstance(node, int):
+            builder.add(
+                parent,
+                name,
+                DE_BRUIJN,
+                node,
+                cast(Data, None),
+            )
+            continue
+
+        index = builder.add(
+            parent, name, ord(node.sop), NO_NODE, node.data
+        )
+        to_visit.extend(
+            (child, index, builder.name_id(child_name))
+            for child_name, child in reversed(
+                tuple(node.children.items())
+            )
+        )
+
+    return builder.build()
+
+
+@dataclass
+class _ArenaBuilder(Generic[T, Data]):
+    name_ids: dict[str, int]
+    kinds: bytearray = field(default_factory=bytearray)
+    parents: array[int] = field(
+        default_factory=lambda: array("i")
+    )
+    first_children: array[int] = field(
+        default_factory=lambda: array("i")
+    )
+    next_siblings: array[int] = field(
+        default_factory=lambda: array("i")
+    )
+    names: array[int] = field(default_factory=lambda: array("i"))
+    de_bruijn: array[int] = field(
+        default_factory=lambda: array("i")
+    )
+    data: list[Data] = field(default_factory=list[Data])
+    last_children: list[int] = field(default_factory=list[int])
+
+    def name_id(self, name: str) -> int:
+        return self.name_ids.setdefault(name, len(self.name_ids))
+
+    def add(
+        self,
+        parent: int,
+        name: int,
+        kind: int,
+        de_bruijn: int,
+        data: Data,
+    ) -> int:
+        """Has to be called in preorder"""
+        index = len(self.kinds)
+        if parent != NO_NODE:
+            if self.first_children[parent] == NO_NODE:
+                self.first_children[parent] = index
+            else:
+                self.next_siblings[
+                    self.last_children[parent]
+                ] = index
+            self.last_children[parent] = index
+
+        self.kinds.append(kind)
+        self.parents.append(parent)
+        self.first_children.append(NO_NODE)
+        self.next_siblings.append(NO_NODE)
+        self.last_children.append(NO_NODE)
+        self.names.append(name)
+        self.de_bruijn.append(de_bruijn)
+        self.data.append(data)
+        return index
+
+    def build(self) -> SOPArena[T, Data]:
+        return SOPArena(
+            bytes(self.kinds),
+            self.parents,
+            self.first_children,
+            self.next_siblings,
+            self.names,
+            tuple(self.name_ids),
+            self.de_bruijn,
+            tuple(self.data),
+            self.name_ids,
+        )
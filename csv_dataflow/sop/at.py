@@ -1,9 +1,18 @@
 from __future__ import annotations
-from dataclasses import replace
-from typing import TYPE_CHECKING, Any, TypeVar
+from dataclasses import dataclass, field, replace
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Generic,
+    Mapping,
+    TypeVar,
+    cast,
+)
 
 from frozendict import frozendict
-from csv_dataflow.cons import Cons, ConsList, at_index
+from csv_dataflow.env import Env, push
+from csv_dataflow.fold import fold
+from csv_dataflow.sop.paths.trie import PathTrie
 
 if TYPE_CHECKING:
     from csv_dataflow.sop import SumProductNode, SumProductPath
@@ -11,22 +20,86 @@ if TYPE_CHECKING:
 T = TypeVar("T")
 Data = TypeVar("Data", default=None)
 
+type _ReplaceItem[Data] = tuple[
+    SumProductNode[Any, Data],
+    PathTrie,
+    Env[SumProductNode[Any, Data]] | None,
+]
+type _ReplaceState[Data] = tuple[
+    SumProductNode[Any, Data], tuple[str, ...]
+]
+"""The node, and the children to put replacements in for"""
+
+
+@dataclass
+class PathIndex(Generic[T, Data]):
+    """
+    The node at each path from a root, filled in as paths get
+    looked up
+
+    Only paths actually in the tree get kept, not ones going round
+    through a de Bruijn index, so it can't grow past the size of
+    the SOP however far down recursive types get looked up. Those
+    get walked from the last node in here, with the nodes on the
+    way there to look the index up in
+    """
+
+    nodes: dict[SumProductPath[T], SumProductNode[Any, Data]] = (
+        field(default_factory=lambda: {})
+    )
+    """Not the root, so it doesn't keep itself alive"""
+
+    def at(
+        self,
+        root: SumProductNode[T, Data],
+        path: SumProductPath[T],
+    ) -> SumProductNode[Any, Data]:
+        nodes = self.nodes
+
+        found = len(path)
+        while found and path[:found] not in nodes:
+            found -= 1
+        if found == len(path):
+            return nodes[path] if path else root
+
+        stack = [
+            root,
+            *(nodes[path[:end]] for end in range(1, found + 1)),
+        ]
+        unrolled = False
+        for end in range(found + 1, len(path) + 1):
+            child = stack[-1].children[path[end - 1]]
+            if isinstance(child, int):
+                # Counting up from the parent, at end - 1
+                assert child < end
+                node = stack[-1 - child]
+                unrolled = True
+            elif unrolled:
+                node = child
+            else:
+                node = nodes.setdefault(path[:end], child)
+            stack.append(node)
+
+        return stack[-1]
+
 
 def at(
     sop: SumProductNode[T, Data],
     path: SumProductPath[T],
-    prev_stack: ConsList[SumProductNode[Any, Data]] = None,
+    prev_stack: Env[SumProductNode[Any, Data]] | None = None,
 ) -> SumProductNode[Any, Data]:
     if not path:
         return sop
+    if prev_stack is None:
+        return sop.path_index().at(sop, path)
 
-    stack = Cons(sop, prev_stack)
+    stack = push(prev_stack, sop)
 
     child = sop.children[path[0]]
     path_tail = path[1:]
 
     if isinstance(child, int):
-        return at_index(stack, child).at(path_tail, stack)
+        return stack[child].at(path_tail, stack)
     else:
         return child.at(path_tail, stack)
 
@@ -35,33 +108,10 @@ def replace_at(
     sop: SumProductNode[T, Data],
     path: SumProductPath[T],
     node: SumProductNode[Any, Data],
-    prev_stack: ConsList[SumProductNode[Any, Data]] = None,
+    prev_stack: Env[SumProductNode[Any, Data]] | None = None,
 ) -> SumProductNode[T, Data]:
     assert path
-    if len(path) == 1:
-        return replace(
-            sop, children={**sop.children, path[0]: node}
-        )
-    else:
-        stack = Cons(sop, prev_stack)
-
-        child = sop.children[path[0]]
-        if isinstance(child, int):
-            unrolled_child = at_index(stack, child)
-        else:
-            unrolled_child = child
-
-        return replace(
-            sop,
-            children=frozendict(
-                {
-                    **sop.children,
-                    path[0]: unrolled_child.replace_at(
-                        path[1:], node, stack
-                    ),
-                }
-            ),
-        )
+    return replace_many(sop, {path: node}, prev_stack=prev_stack)
 
 
 def replace_data_at(
@@ -69,4 +119,72 @@ def replace_data_at(
     path: SumProductPath[T],
     data: Data,
 ) -> SumProductNode[T, Data]:
-    return sop.replace_at(path, replace(sop.at(path), data=data))
+    return replace_many(sop, data={path: data})
+
+
+def replace_many(
+    sop: SumProductNode[T, Data],
+    nodes: Mapping[
+        SumProductPath[T], SumProductNode[Any, Data]
+    ] = frozendict[Any, Any](),
+    data: Mapping[SumProductPath[T], Data] = frozendict[
+        Any, Any
+    ](),
+    prev_stack: Env[SumProductNode[Any, Data]] | None = None,
+) -> SumProductNode[T, Data]:
+    """
+    All the replacements at once, so every node on the way to
+    them only gets rebuilt once
+
+    Shorter paths go first, and at the same path the node before
+    the data, so a path can go on through a node replaced above it.
+    A de Bruijn index on the way gets unrolled to the node as it is
+    by then, before anything under it has been replaced
+    """
+    # Labelled by where they are in here
+    replacements = (*nodes.values(), *data.values())
+    trie = PathTrie()
+    for label, path in enumerate((*nodes, *data)):
+        trie.add(path, label)
+
+    def expand(
+        item: _ReplaceItem[Data],
+    ) -> tuple[
+        _ReplaceState[Data], tuple[_ReplaceItem[Data], ...]
+    ]:
+        node, trie, prev_stack = item
+        for label in sorted(trie.ends):
+            if label < len(nodes):
+                node = cast(
+                    "SumProductNode[Any, Data]",
+                    replacements[label],
+                )
+            else:
+                node = replace(
+                    node, data=cast(Data, replacements[label])
+                )
+
+        stack = push(prev_stack, node)
+        children: list[_ReplaceItem[Data]] = []
+        for path, child_trie in trie.children.items():
+            child = node.children[path]
+            if isinstance(child, int):
+                child = stack[child]
+            children.append((child, child_trie, stack))
+        return (node, tuple(trie.children)), tuple(children)
+
+    def combine(
+        state: _ReplaceState[Data],
+        replaced: list[SumProductNode[Any, Data]],
+    ) -> SumProductNode[Any, Data]:
+        node, paths = state
+        if not paths:
+            return node
+        return replace(
+            node,
+            children=frozendict(
+                {**node.children, **dict(zip(paths, replaced))}
+            ),
+        )
+
+    return fold((sop, trie, prev_stack), expand, combine)
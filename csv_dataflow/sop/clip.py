@@ -1,14 +1,14 @@
 from __future__ import annotations
-from dataclasses import replace
-from typing import TYPE_CHECKING, Any, TypeVar
+from dataclasses import dataclass, field, replace
+from typing import TYPE_CHECKING, Any, Generic, TypeVar, cast
 
 from frozendict import frozendict
 
-from csv_dataflow.cons import Cons, ConsList, at_index
+from csv_dataflow.env import Env, push
+from csv_dataflow.fold import fold
 
 if TYPE_CHECKING:
     from csv_dataflow.sop import (
-        SumProductChild,
         SumProductNode,
         SumProductPath,
     )
@@ -16,35 +16,52 @@ if TYPE_CHECKING:
 T = TypeVar("T")
 Data = TypeVar("Data", default=None)
 
+type _ClipItem[Data] = tuple[
+    SumProductNode[Any, Data],
+    SumProductNode[Any, Any],
+    Env[SumProductNode[Any, Data]] | None,
+]
+type _ClipState[Data] = tuple[
+    SumProductNode[Any, Data], tuple[str, ...]
+]
+
+
+def _stops_at(
+    sop: SumProductNode[Any, Any], child_path: str
+) -> bool:
+    """Whether clipping a path going on to `child_path` ends here"""
+    if sop.children.get(child_path):
+        return False
+    if sop.children:
+        raise Exception(
+            "Will only clip a path if an empty node is found"
+            " along it, not if there are children but the"
+            " next one on the path isn't found"
+        )
+    return True
+
 
 def clip_path(
     sop: SumProductNode[T, Data],
     path: SumProductPath[T],
     path_prefix: SumProductPath[T] = (),
-    prev_stack: ConsList[SumProductNode[Any, Data]] = None,
+    prev_stack: Env[SumProductNode[Any, Data]] | None = None,
 ) -> SumProductPath[T]:
     if not path:
         return path_prefix
 
     child_path, path_tail = path[0], path[1:]
 
-    child = sop.children.get(child_path)
-
-    if not child:
-        if sop.children:
-            raise Exception(
-                "Will only clip a path if an empty node is found"
-                " along it, not if there are children but the"
-                " next one on the path isn't found"
-            )
+    if _stops_at(sop, child_path):
         return path_prefix
 
-    stack = Cons(sop, prev_stack)
+    child = sop.children[child_path]
+    stack = push(prev_stack, sop)
 
     child_path_prefix = (*path_prefix, child_path)
 
     if isinstance(child, int):
-        return at_index(stack, child).clip_path(
+        return stack[child].clip_path(
             path_tail, child_path_prefix, stack
         )
     else:
@@ -56,25 +73,111 @@ def clip_path(
 def clip(
     sop: SumProductNode[T, Data],
     clip_sop: SumProductNode[T, Any],
-    prev_stack: ConsList[SumProductNode[Any, Data]] = None,
+    prev_stack: Env[SumProductNode[Any, Data]] | None = None,
 ) -> SumProductNode[T, Data]:
-    stack = Cons(sop, prev_stack)
-
-    children_dict: dict[str, SumProductChild[Data]] = {}
-    for path, clip_child in clip_sop.children.items():
-        assert not isinstance(
-            clip_child, int
-        ), "Potentially this could make sense but we haven't needed it yet"
-
-        sop_child = sop.children.get(path)
-        if isinstance(sop_child, int):
-            unrolled_sop_child = at_index(stack, sop_child)
-        else:
-            unrolled_sop_child = sop_child
-
-        if unrolled_sop_child:
-            children_dict[path] = clip(
-                unrolled_sop_child, clip_child, stack
-            )
+    def expand(
+        item: _ClipItem[Data],
+    ) -> tuple[_ClipState[Data], tuple[_ClipItem[Data], ...]]:
+        sop, clip_sop, prev_stack = item
+        stack = push(prev_stack, sop)
+
+        paths: list[str] = []
+        children: list[_ClipItem[Data]] = []
+        for path, clip_child in clip_sop.children.items():
+            assert not isinstance(
+                clip_child, int
+            ), "Potentially this could make sense but we haven't needed it yet"
+
+            sop_child = sop.children.get(path)
+            if isinstance(sop_child, int):
+                unrolled_sop_child = stack[sop_child]
+            else:
+                unrolled_sop_child = sop_child
+
+            if unrolled_sop_child:
+                paths.append(path)
+                children.append(
+                    (unrolled_sop_child, clip_child, stack)
+                )
+
+        return (sop, tuple(paths)), tuple(children)
+
+    def combine(
+        state: _ClipState[Data],
+        clipped: list[SumProductNode[Any, Data]],
+    ) -> SumProductNode[Any, Data]:
+        sop, paths = state
+        return replace(
+            sop,
+            children=frozendict(zip(paths, clipped)),
+        )
 
-    return replace(sop, children=frozendict(children_dict))
+    return fold((sop, clip_sop, prev_stack), expand, combine)
+
+
+@dataclass
+class ClipContext(Generic[T]):
+    """
+    Clipping lots of things against the same `clip_sop`, each
+    path prefix and each node only getting clipped once
+
+    Walking a path carries on from the longest prefix already
+    walked, and a node is clipped once for each node of `clip_sop`
+    it gets clipped against
+    """
+
+    clip_sop: SumProductNode[T, Any]
+    paths: dict[SumProductPath[T], SumProductPath[T]] = field(
+        default_factory=lambda: {}, repr=False
+    )
+    clipped: dict[
+        tuple[int, int],
+        tuple[
+            SumProductNode[Any, Any],
+            SumProductNode[Any, Any],
+            SumProductNode[Any, Any],
+        ],
+    ] = field(default_factory=lambda: {}, repr=False)
+    """Keeping hold of the nodes too, so the ids stay theirs"""
+
+    def at(
+        self, path: SumProductPath[T]
+    ) -> SumProductNode[Any, Any]:
+        return self.clip_sop.at(path)
+
+    def clip_path(
+        self, path: SumProductPath[T]
+    ) -> SumProductPath[T]:
+        """`self.clip_sop.clip_path(path)`"""
+        paths = self.paths
+        found = len(path)
+        while found and path[:found] not in paths:
+            found -= 1
+        clipped = paths[path[:found]] if found else ()
+
+        for end in range(found + 1, len(path) + 1):
+            # Otherwise it's already stopped further up
+            if len(clipped) == end - 1 and not _stops_at(
+                self.at(path[: end - 1]), path[end - 1]
+            ):
+                clipped = path[:end]
+            paths[path[:end]] = clipped
+
+        return clipped
+
+    def clip(
+        self,
+        sop: SumProductNode[T, Data],
+        path: SumProductPath[T],
+    ) -> SumProductNode[T, Data]:
+        """`sop.clip(self.at(path))`"""
+        clip_sop = self.at(path)
+        key = (id(sop), id(clip_sop))
+        cached = self.clipped.get(key)
+        if cached is None:
+            cached = self.clipped[key] = (
+                sop,
+                clip_sop,
+                sop.clip(clip_sop),
+            )
+        return cast("SumProductNode[T, Data]", cached[2])
@@ -1,58 +1,226 @@
-from dataclasses import fields, is_dataclass
+from dataclasses import dataclass, fields, is_dataclass
+from threading import Lock
 import types
-from typing import Any, TypeVar, get_args, get_origin
+from typing import (
+    Any,
+    TypeVar,
+    Union,
+    get_args,
+    get_origin,
+    get_type_hints,
+)
 
 from frozendict import frozendict
-from csv_dataflow.sop import UNIT, SumOrProduct, SumProductChild, SumProductNode
+from csv_dataflow.cons import Cons, ConsList, iter_cons_list
+from csv_dataflow.fold import fold
+from csv_dataflow.sop import (
+    SumOrProduct,
+    SumProductChild,
+    SumProductNode,
+)
 
 T = TypeVar("T")
+Data = TypeVar("Data", default=None)
 
 
-def sop_from_type(t: type[T]) -> SumProductNode[T]:
-    sop: SumOrProduct
-    child_types: dict[str, Any]
-    if get_origin(t) is types.UnionType:
-        sop = "+"
-        child_types = {
+@dataclass(frozen=True)
+class _Converted:
+    sop: SumProductChild
+    types: frozenset[Any]
+    """
+    Every type converted for it, so it can be reused anywhere none
+    of them are already being converted above
+    """
+    open: frozenset[Any]
+    """Types above it its de Bruijn indices point to"""
+
+
+_cache: dict[Any, _Converted] = {}
+_cache_lock = Lock()
+
+type _TypeItem = tuple[Any, int, ConsList[tuple[Any, int]]]
+"""The type, how deep its node is, and the types above it"""
+type _TypeState = (
+    tuple[Any, SumOrProduct, tuple[str, ...]]
+    | tuple[Any, None, tuple[str, ...]]
+    | _Converted
+)
+"""
+The sort of node, or None for a list, whose element type is the
+only child. Or it's already been done
+"""
+
+
+def _substitute(t: Any, arguments: dict[Any, Any]) -> Any:
+    """Type variables in `t` swapped for what they're bound to"""
+    if isinstance(t, TypeVar):
+        return arguments.get(t, t)
+
+    parameters = getattr(t, "__parameters__", ())
+    if parameters and get_origin(t) is not None:
+        return t[tuple(arguments.get(p, p) for p in parameters)]
+    return t
+
+
+def _field_types(t: Any) -> dict[str, Any]:
+    origin = get_origin(t) or t
+    try:
+        hints = get_type_hints(origin)
+    except Exception:
+        # Forward references it can't resolve, go with the strings
+        hints = {}
+
+    arguments = dict(
+        zip(getattr(origin, "__parameters__", ()), get_args(t))
+    )
+    return {
+        field.name: _substitute(
+            hints.get(field.name, field.type), arguments
+        )
+        for field in fields(origin)
+    }
+
+
+def children_of_type(
+    t: Any,
+) -> tuple[SumOrProduct, dict[str, Any]] | None:
+    """
+    What sort of node a type is and its children's types. None
+    for a list or tuple, which is a sum of empty and a product of
+    the element type and the rest
+    """
+    if get_origin(t) in (types.UnionType, Union):
+        return "+", {
             child_type.__name__: child_type
             for child_type in get_args(t)
         }
-    elif is_dataclass(t):
-        sop = "*"
-        child_types = {
-            field.name: field.type for field in fields(t)
-        }
+    elif is_dataclass(get_origin(t) or t):
+        return "*", _field_types(t)
     elif get_origin(t) in (tuple, list):
-        return SumProductNode(
-            "+",
-            frozendict[str, SumProductChild](
-                {
-                    "empty": UNIT,
-                    "list": SumProductNode(
-                        "*",
-                        frozendict[str, SumProductChild](
-                            {
-                                "head": sop_from_type(
-                                    get_args(t)[0]
-                                ),
-                                "tail": 1,
-                            }
-                        ),
-                    ),
-                }
-            ),
-        )
+        return None
     else:
         # Assume remaining types are primitive i.e. sum
-        sop = "+"
-        child_types = {}
+        return "+", {}
+
 
+def de_bruijn_index(
+    t: Any, depth: int, above: ConsList[tuple[Any, int]]
+) -> int | None:
+    """If `t` is already being converted above, back to there"""
+    for above_t, above_depth in iter_cons_list(above):
+        if above_t == t:
+            # Counting from the parent
+            return depth - 1 - above_depth
+    return None
+
+
+def list_sop(
+    head: SumProductChild[Data], data: Data = None
+) -> SumProductNode[Any, Data]:
+    """A list of `head` as a sum of empty and a product"""
     return SumProductNode(
-        sop,
-        frozendict[str, SumProductChild](
+        "+",
+        frozendict[str, SumProductChild[Data]](
             {
-                key: sop_from_type(child_type)
-                for key, child_type in child_types.items()
+                "empty": SumProductNode(
+                    "*",
+                    frozendict[str, SumProductChild[Data]](),
+                    data,
+                ),
+                "list": SumProductNode(
+                    "*",
+                    frozendict[str, SumProductChild[Data]](
+                        {"head": head, "tail": 1}
+                    ),
+                    data,
+                ),
             }
         ),
+        data,
     )
+
+
+def sop_from_type(t: type[T]) -> SumProductNode[T]:
+    """
+    Worked out once for each type, then shared
+
+    A type inside itself (by any route) becomes a de Bruijn index
+    back to where it started
+    """
+    with _cache_lock:
+        converted = _cache.get(t)
+    if converted is not None:
+        assert not isinstance(converted.sop, int)
+        return converted.sop
+
+    def expand(
+        item: _TypeItem,
+    ) -> tuple[_TypeState, tuple[_TypeItem, ...]]:
+        t, depth, above = item
+        index = de_bruijn_index(t, depth, above)
+        if index is not None:
+            return (
+                _Converted(index, frozenset(), frozenset((t,))),
+                (),
+            )
+
+        with _cache_lock:
+            converted = _cache.get(t)
+        if converted is not None and not any(
+            above_t in converted.types
+            for above_t, _ in iter_cons_list(above)
+        ):
+            return converted, ()
+
+        child_above = Cons((t, depth), above)
+        node_children = children_of_type(t)
+        if node_children is None:
+            # Under the sum and the product
+            return (t, None, ()), (
+                (get_args(t)[0], depth + 2, child_above),
+            )
+
+        sop, child_types = node_children
+        return (t, sop, tuple(child_types)), tuple(
+            (child_type, depth + 1, child_above)
+            for child_type in child_types.values()
+        )
+
+    def combine(
+        state: _TypeState, children: list[_Converted]
+    ) -> _Converted:
+        if isinstance(state, _Converted):
+            return state
+
+        t, sop, keys = state
+        node: SumProductNode[Any]
+        if sop is None:
+            node = list_sop(children[0].sop)
+        else:
+            node = SumProductNode(
+                sop,
+                frozendict[str, SumProductChild](
+                    zip(keys, (child.sop for child in children))
+                ),
+            )
+
+        converted = _Converted(
+            node,
+            frozenset((t,)).union(
+                *(child.types for child in children)
+            ),
+            frozenset[Any]()
+            .union(*(child.open for child in children))
+            .difference((t,)),
+        )
+        # Otherwise it'd need the same things above it to mean the
+        # same thing
+        if not converted.open:
+            with _cache_lock:
+                # Whichever thread got there first
+                converted = _cache.setdefault(t, converted)
+        return converted
+
+    converted = fold((t, 0, None), expand, combine)
+    assert not isinstance(converted.sop, int)
+    return converted.sop
@@ -0,0 +1,146 @@
+from threading import Lock
+from typing import Any, Hashable, Mapping, TypeVar
+from weakref import WeakValueDictionary
+
+from frozendict import frozendict
+
+from csv_dataflow.fold import fold
+from csv_dataflow.sop import (
+    UNIT,
+    VOID,
+    SumOrProduct,
+    SumProductChild,
+    SumProductNode,
+)
+
+T = TypeVar("T")
+Data = TypeVar("Data", default=None)
+
+type InternKey = tuple[
+    SumOrProduct,
+    tuple[tuple[str, bool, int], ...],
+    type[object],
+    Hashable,
+]
+
+_interned: WeakValueDictionary[
+    InternKey, SumProductNode[Any, Any]
+] = WeakValueDictionary()
+_lock = Lock()
+
+
+def intern_key(
+    sop: SumOrProduct,
+    children: Mapping[str, SumProductChild[Any]],
+    data: object,
+) -> InternKey:
+    """
+    Children by identity and in order, so nodes with the same key
+    look the same everywhere, unlike `==` which ignores the order
+    """
+    return (
+        sop,
+        tuple(
+            (
+                (name, True, child)
+                if isinstance(child, int)
+                else (name, False, id(child))
+            )
+            for name, child in children.items()
+        ),
+        # Otherwise True and 1 would be the same
+        type(data),
+        data,
+    )
+
+
+def interned_node(
+    sop: SumOrProduct,
+    children: Mapping[str, SumProductChild[Data]],
+    data: Data = None,
+) -> SumProductNode[Any, Data]:
+    """
+    `SumProductNode(sop, children, data)`, unless an equal node
+    made here is still alive, in which case it's that one
+
+    Children are compared by identity, so only get shared if they
+    came from here too. Data has to be hashable, otherwise this
+    just makes a new node
+    """
+    try:
+        key = intern_key(sop, children, data)
+        hash(key)
+    except TypeError:
+        return SumProductNode(
+            sop,
+            frozendict[str, SumProductChild[Data]](children),
+            data,
+        )
+
+    with _lock:
+        node = _interned.get(key)
+        if node is None:
+            node = _interned[key] = SumProductNode(
+                sop,
+                frozendict[str, SumProductChild[Data]](children),
+                data,
+            )
+        return node
+
+
+def intern_sop(
+    sop: SumProductNode[T, Data],
+) -> SumProductNode[T, Data]:
+    """
+    The interned version of every node in `sop`, so any subtree
+    equal to one elsewhere (with the children in the same order)
+    is the same object
+    """
+    # By id, so a subtree used in more than one place only gets
+    # walked once
+    done: dict[int, SumProductNode[Any, Data]] = {}
+
+    def expand(
+        node: SumProductNode[Any, Data],
+    ) -> tuple[
+        SumProductNode[Any, Data],
+        tuple[SumProductNode[Any, Data], ...],
+    ]:
+        if id(node) in done:
+            return node, ()
+        return node, tuple(
+            child
+            for child in node.children.values()
+            if not isinstance(child, int)
+        )
+
+    def combine(
+        node: SumProductNode[Any, Data],
+        interned: list[SumProductNode[Any, Data]],
+    ) -> SumProductNode[Any, Data]:
+        if id(node) in done:
+            return done[id(node)]
+
+        interned_children = iter(interned)
+        done[id(node)] = interned_node(
+            node.sop,
+            {
+                name: (
+                    child
+                    if isinstance(child, int)
+                    else next(interned_children)
+                )
+                for name, child in node.children.items()
+            },
+            node.data,
+        )
+        return done[id(node)]
+
+    return fold(sop, expand, combine)
+
+
+# So all the empty leaves end up as these
+for _node in (UNIT, VOID):
+    _interned[
+        intern_key(_node.sop, _node.children, _node.data)
+    ] = _node
@@ -0,0 +1,165 @@
+from __future__ import annotations
+from dataclasses import dataclass, field
+from typing import (
+    Any,
+    Iterator,
+    Mapping,
+    TypeVar,
+    cast,
+    get_args,
+)
+
+from frozendict import frozendict
+
+from csv_dataflow.cons import Cons, ConsList
+from csv_dataflow.sop import SumProductChild, SumProductNode
+from csv_dataflow.sop.from_type import (
+    children_of_type,
+    de_bruijn_index,
+    list_sop,
+)
+
+T = TypeVar("T")
+Data = TypeVar("Data", default=None)
+OtherData = TypeVar("OtherData")
+
+
+@dataclass(eq=False)
+class LazyChildren(Mapping[str, SumProductChild[Data]]):
+    """
+    The children of the node for a type, only worked out from it
+    the first time anything looks at them. Each child's children
+    are lazy too
+
+    Everything not worked out yet has the same `data`, so mapping
+    over it doesn't need working out either
+
+    Equal to (and hashes the same as) the frozendict it stands
+    for, so a lazy SOP is equal to `sop_from_type`'s
+    """
+
+    t: Any
+    depth: int
+    above: ConsList[tuple[Any, int]]
+    """The types above and their depths, for de Bruijn indices"""
+    data: Data
+    _children: frozendict[str, SumProductChild[Data]] | None = (
+        field(default=None, repr=False)
+    )
+
+    @property
+    def forced(self) -> bool:
+        return self._children is not None
+
+    def force(self) -> frozendict[str, SumProductChild[Data]]:
+        # Two threads might both work it out, but they'll get the
+        # same thing
+        if self._children is None:
+            self._children = _type_children(
+                self.t, self.depth, self.above, self.data
+            )
+        return self._children
+
+    def with_data(
+        self, data: OtherData
+    ) -> LazyChildren[OtherData]:
+        """Only while not forced, after that the data can differ"""
+        assert not self.forced
+        return LazyChildren(self.t, self.depth, self.above, data)
+
+    def __getitem__(self, key: str) -> SumProductChild[Data]:
+        return self.force()[key]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.force())
+
+    def __len__(self) -> int:
+        return len(self.force())
+
+    def __hash__(self) -> int:
+        return hash(self.force())
+
+    def __reduce__(self) -> tuple[Any, ...]:
+        # Whatever's been worked out can be worked out again
+        return LazyChildren, (
+            self.t,
+            self.depth,
+            self.above,
+            self.data,
+        )
+
+
+def unforced_children(
+    sop: SumProductNode[Any, Data],
+) -> LazyChildren[Data] | None:
+    """Its children, if they haven't been worked out yet"""
+    children = sop.children
+    if (
+        isinstance(children, LazyChildren)
+        and not children.forced
+    ):
+        return cast(LazyChildren[Data], children)
+    return None
+
+
+def _type_children(
+    t: Any,
+    depth: int,
+    above: ConsList[tuple[Any, int]],
+    data: Data,
+) -> frozendict[str, SumProductChild[Data]]:
+    def child(
+        child_type: Any, child_depth: int
+    ) -> SumProductChild[Data]:
+        index = de_bruijn_index(
+            child_type, child_depth, child_above
+        )
+        if index is not None:
+            return index
+        return _lazy_node(
+            child_type, child_depth, child_above, data
+        )
+
+    child_above = Cons((t, depth), above)
+    node_children = children_of_type(t)
+    if node_children is None:
+        # Under the sum and the product
+        return cast(
+            frozendict[str, SumProductChild[Data]],
+            list_sop(
+                child(get_args(t)[0], depth + 2), data
+            ).children,
+        )
+
+    _, child_types = node_children
+    return frozendict[str, SumProductChild[Data]](
+        (name, child(child_type, depth + 1))
+        for name, child_type in child_types.items()
+    )
+
+
+def _lazy_node(
+    t: Any,
+    depth: int,
+    above: ConsList[tuple[Any, int]],
+    data: Data,
+) -> SumProductNode[Any, Data]:
+    node_children = children_of_type(t)
+    return SumProductNode(
+        "+" if node_children is None else node_children[0],
+        LazyChildren(t, depth, above, data),
+        data,
+    )
+
+
+def lazy_sop_from_type(t: type[T]) -> SumProductNode[T]:
+    """
+    Like `sop_from_type`, but each node's children are only
+    worked out when something looks at them, so looking at a small
+    part of a huge type only pays for that part
+
+    The GUI doesn't use this, its pages are of SOPs with the CSV's
+    values added, which needs the whole tree anyway. It's for code
+    starting from just the type
+    """
+    return _lazy_node(t, 0, None, None)
@@ -0,0 +1,81 @@
+from __future__ import annotations
+from dataclasses import dataclass, field
+from typing import (
+    Any,
+    Callable,
+    Generic,
+    Iterator,
+    Mapping,
+    TypeVar,
+)
+
+from frozendict import frozendict
+
+from csv_dataflow.sop import SumProductChild, SumProductNode
+from csv_dataflow.sop.lazy import unforced_children
+
+Data = TypeVar("Data")
+OtherData = TypeVar("OtherData")
+
+
+@dataclass(eq=False)
+class MappedChildren(
+    Mapping[str, SumProductChild[OtherData]],
+    Generic[Data, OtherData],
+):
+    """
+    `children` with `f` mapped over their data, each child only
+    getting mapped when it's first looked up, then kept
+
+    Pickles as the frozendict it stands for, as `f` is usually a
+    lambda
+    """
+
+    children: Mapping[str, SumProductChild[Data]]
+    f: Callable[[Data], OtherData]
+    _mapped: dict[str, SumProductChild[OtherData]] = field(
+        default_factory=lambda: {}, repr=False
+    )
+
+    def __getitem__(
+        self, key: str
+    ) -> SumProductChild[OtherData]:
+        mapped = self._mapped.get(key)
+        if mapped is None:
+            child = self.children[key]
+            mapped = self._mapped.setdefault(
+                key,
+                (
+                    child
+                    if isinstance(child, int)
+                    else mapped_view(child, self.f)
+                ),
+            )
+        return mapped
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.children)
+
+    def __len__(self) -> int:
+        return len(self.children)
+
+    def __hash__(self) -> int:
+        return hash(
+            frozendict[str, SumProductChild[OtherData]](self)
+        )
+
+    def __reduce__(self) -> tuple[Any, ...]:
+        return frozendict, (dict(self),)
+
+
+def mapped_view(
+    sop: SumProductNode[Any, Data],
+    f: Callable[[Data], OtherData],
+) -> SumProductNode[Any, OtherData]:
+    """`sop.map_data(f)`, but only mapping nodes as they're got to"""
+    if unforced_children(sop) is not None:
+        # Mapping that doesn't look at anything under it anyway
+        return sop.map_data(f)
+    return SumProductNode(
+        sop.sop, MappedChildren(sop.children, f), f(sop.data)
+    )
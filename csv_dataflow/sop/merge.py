@@ -1,75 +1,101 @@
 from dataclasses import replace
 from itertools import chain
-from typing import TypeVar, cast
+from typing import Any, TypeVar, cast
 
 from frozendict import frozendict
+from csv_dataflow.fold import fold
 from csv_dataflow.sop import SumProductChild, SumProductNode
 
 T = TypeVar("T")
 Data = TypeVar("Data", default=None)
 
+type _MergeState[Data] = tuple[
+    SumProductNode[Any, Data],
+    tuple[tuple[str, SumProductChild[Data] | None], ...],
+]
+"""
+Recursion paths keep their de Bruijn index, the rest have their
+merged children come back from the fold
+"""
+
 
 def merge(
     *sops: SumProductNode[T, Data]
 ) -> SumProductNode[T, Data]:
-    first, *rest = sops
-
-    assert all(
-        sop.sop == first.sop and sop.data == first.data
-        for sop in rest
-    )
+    def expand(
+        sops: tuple[SumProductNode[Any, Data], ...],
+    ) -> tuple[
+        _MergeState[Data],
+        tuple[tuple[SumProductNode[Any, Data], ...], ...],
+    ]:
+        first, *rest = sops
 
-    child_paths = tuple(
-        map(lambda sop: sop.children.keys(), sops)
-    )
+        assert all(
+            sop.sop == first.sop and sop.data == first.data
+            for sop in rest
+        )
 
-    all_child_paths = {
-        x: None for x in chain.from_iterable(child_paths)
-    }.keys()
+        child_paths = tuple(
+            map(lambda sop: sop.children.keys(), sops)
+        )
 
-    recursion_paths: list[str] = []
+        all_child_paths = {
+            x: None for x in chain.from_iterable(child_paths)
+        }.keys()
 
-    # Make sure they have the same recursion structure, not dealing
-    # with it otherwise
-    for path in all_child_paths:
-        first_child, *rest_children = filter(
-            None, (sop.children.get(path) for sop in sops)
+        paths: list[tuple[str, SumProductChild[Data] | None]] = (
+            []
+        )
+        to_merge: list[tuple[SumProductNode[Any, Data], ...]] = (
+            []
         )
-        if isinstance(first_child, int):
-            for child in rest_children:
-                assert first_child == child
-            recursion_paths.append(path)
-        else:
-            for child in rest_children:
-                # This should make the cast below safe
-                assert not isinstance(child, int)
 
-    return replace(
-        first,
-        children=frozendict[str, SumProductChild[Data]](
-            {
-                path: (
-                    children[0]
-                    if path in recursion_paths
-                    else merge(
-                        *cast(
-                            tuple[SumProductNode[T, Data], ...],
-                            children,
-                        )
-                    )
+        # Make sure they have the same recursion structure, not
+        # dealing with it otherwise
+        for path in all_child_paths:
+            children = tuple(
+                filter(
+                    None,
+                    (sop.children.get(path) for sop in sops),
                 )
-                for path in all_child_paths
-                for children in (
-                    tuple(
-                        filter(
-                            None,
-                            (
-                                sop.children.get(path)
-                                for sop in sops
-                            ),
-                        )
-                    ),
+            )
+            first_child, *rest_children = children
+            if isinstance(first_child, int):
+                for child in rest_children:
+                    assert first_child == child
+                paths.append((path, first_child))
+            else:
+                for child in rest_children:
+                    # This should make the cast below safe
+                    assert not isinstance(child, int)
+                paths.append((path, None))
+                to_merge.append(
+                    cast(
+                        tuple[SumProductNode[Any, Data], ...],
+                        children,
+                    )
                 )
-            }
-        ),
-    )
+
+        return (first, tuple(paths)), tuple(to_merge)
+
+    def combine(
+        state: _MergeState[Data],
+        merged: list[SumProductNode[Any, Data]],
+    ) -> SumProductNode[Any, Data]:
+        first, paths = state
+        merged_children = iter(merged)
+        return replace(
+            first,
+            children=frozendict[str, SumProductChild[Data]](
+                {
+                    path: (
+                        next(merged_children)
+                        if recursion_child is None
+                        else recursion_child
+                    )
+                    for path, recursion_child in paths
+                }
+            ),
+        )
+
+    return fold(sops, expand, combine)
@@ -0,0 +1,118 @@
+from __future__ import annotations
+from dataclasses import dataclass, replace
+from typing import Any, Generic, Iterator, TypeVar, cast
+
+from csv_dataflow.sop import SumProductNode, SumProductPath
+from csv_dataflow.sop.arena import SOPArena, sop_arena
+
+T = TypeVar("T")
+
+
+@dataclass(frozen=True, slots=True)
+class BoolOverlay(Generic[T]):
+    """
+    A bool for each node of `base`, as the bits of an int, bit i
+    being node i of the arena. `base`'s own data doesn't matter
+
+    A subtree is a run of nodes in preorder, so anything about a
+    whole subtree is a mask and an and, rather than a walk
+    """
+
+    base: SOPArena[T, Any]
+    bits: int = 0
+
+    def to_sop(self) -> SumProductNode[T, bool]:
+        flags = self._flags()
+        return cast(
+            SOPArena[T, bool],
+            replace(
+                self.base,
+                data=tuple(
+                    index < len(flags) and flags[index] == "1"
+                    for index in range(len(self.base))
+                ),
+            ),
+        ).to_sop()
+
+    def _flags(self) -> str:
+        """ "0" or "1" for each node, as far as the last set one"""
+        return f"{self.bits:b}"[::-1]
+
+    def __getitem__(self, index: int) -> bool:
+        return bool(self.bits >> index & 1)
+
+    def at(self, path: SumProductPath[T]) -> bool:
+        return self[self.base.at(path)]
+
+    def with_bit(
+        self, index: int, value: bool = True
+    ) -> BoolOverlay[T]:
+        if value:
+            return replace(self, bits=self.bits | 1 << index)
+        return replace(self, bits=self.bits & ~(1 << index))
+
+    def subtree_mask(self, index: int) -> int:
+        """The bits for `index` and everything under it"""
+        return (1 << self.base.subtree_end(index)) - (1 << index)
+
+    def any_under(self, index: int) -> bool:
+        """Anything set under `index`, not counting itself"""
+        return bool(
+            self.bits & self.subtree_mask(index) & ~(1 << index)
+        )
+
+    def iter_set(self) -> Iterator[int]:
+        for index, flag in enumerate(self._flags()):
+            if flag == "1":
+                yield index
+
+    def __len__(self) -> int:
+        """How many are set"""
+        return self.bits.bit_count()
+
+    def __or__(self, other: BoolOverlay[T]) -> BoolOverlay[T]:
+        self._check_base(other)
+        return replace(self, bits=self.bits | other.bits)
+
+    def __and__(self, other: BoolOverlay[T]) -> BoolOverlay[T]:
+        self._check_base(other)
+        return replace(self, bits=self.bits & other.bits)
+
+    def _check_base(self, other: BoolOverlay[T]) -> None:
+        if other.base is not self.base and not _same_shape(
+            other.base, self.base
+        ):
+            raise ValueError("Overlays of different bases")
+
+
+def bool_overlay(
+    sop: SumProductNode[T, bool],
+    base: SOPArena[T, Any] | None = None,
+) -> BoolOverlay[T]:
+    """`sop` has to be the same shape as `base`, if given"""
+    arena = sop_arena(sop)
+    if base is None:
+        base = arena
+    elif not _same_shape(arena, base):
+        raise ValueError("Not the same shape as the base")
+
+    # Through bytes, as or-ing in one bit at a time copies the whole
+    # int every time
+    flags = bytearray((len(arena) + 7) // 8)
+    for index, data in enumerate(arena.data):
+        if data:
+            flags[index >> 3] |= 1 << (index & 7)
+    return BoolOverlay(base, int.from_bytes(flags, "little"))
+
+
+def _same_shape(
+    a: SOPArena[Any, Any], b: SOPArena[Any, Any]
+) -> bool:
+    return (
+        a.kinds == b.kinds
+        and a.parents == b.parents
+        and a.de_bruijn == b.de_bruijn
+        # The root doesn't have a name
+        and [a.name_table[name] for name in a.names[1:]]
+        == [b.name_table[name] for name in b.names[1:]]
+    )
@@ -1,7 +1,9 @@
-from typing import Any, Collection, TypeVar
+from dataclasses import dataclass
+from itertools import islice
+from typing import Any, Collection, TypeVar, cast
 
 from frozendict import frozendict
-from csv_dataflow.cons import Cons, ConsList, at_index
+from csv_dataflow.env import Env
 from csv_dataflow.sop import (
     UNIT,
     DeBruijn,
@@ -9,59 +11,224 @@ from csv_dataflow.sop import (
     SumProductNode,
     SumProductPath,
 )
-
+from csv_dataflow.sop.paths.trie import PathTrie
 
 T = TypeVar("T")
 Data = TypeVar("Data", default=None)
 
 
+@dataclass(slots=True)
+class _Frame[Data]:
+    """A node partway through, waiting on its children"""
+
+    node: SumProductNode[Any, Data]
+    tries: tuple[PathTrie, ...]
+    recursing: bool
+    values: tuple[str, ...]
+    value_set: frozenset[str]
+    """`values` to look up in, only with `values_added`"""
+    children: list[tuple[str, SumProductChild[Data]]]
+    added: list[SumProductChild[Data]]
+    """What each of `children` came back as so far"""
+
+
 def add_values_at_paths(
     node: SumProductNode[T, Data] | DeBruijn,
-    paths: Collection[SumProductPath[T]],
-    prev_stack: ConsList[SumProductNode[Any, Data]] = None,
-    active_paths: Collection[SumProductPath[T]] = (),
-    recursing: bool = False,
+    paths: Collection[SumProductPath[T]] | PathTrie,
+    prev_stack: Env[SumProductNode[Any, Data]] | None = None,
 ) -> SumProductNode[T, Data] | DeBruijn:
     """
     Find the penultimate node of each path and add the final
     value to it as a child
 
     The paths don't have to be anchored at the root, any sequence
-    of branches that matches works
+    of branches that matches works. Put them in a trie first if
+    adding the same paths more than once
     """
-    if isinstance(node, DeBruijn):
-        if recursing:
-            return node
-
-        node = at_index(prev_stack, node)
-        recursing = True
-
-    paths = (*paths, *active_paths)
-
-    values = tuple(path[0] for path in paths if len(path) == 1)
-
-    children = frozendict[str, SumProductChild[Data]](
-        {
-            **{value: UNIT for value in values},
-            **{
-                child_path: add_values_at_paths(
-                    child,
-                    paths,
-                    Cons(node, prev_stack),
-                    tuple(
-                        path[1:]
-                        for path in paths
-                        if path[0] == child_path
-                    ),
-                    recursing,
-                )
-                for child_path, child in node.children.items()
-            },
-        }
+    if not isinstance(paths, PathTrie):
+        paths = PathTrie.from_paths(paths)
+    return add_values_at_trie(node, paths, prev_stack)
+
+
+def _with_values[Data](
+    frame: _Frame[Data],
+) -> SumProductNode[Any, Data]:
+    node = frame.node
+    if not frame.values and all(
+        added is child
+        for added, (_, child) in zip(frame.added, frame.children)
+    ):
+        return node
+
+    return SumProductNode(
+        node.sop,
+        frozendict[str, SumProductChild[Data]](
+            {
+                **{value: UNIT for value in frame.values},
+                **dict(zip(node.children, frame.added)),
+            }
+        ),
+        node.data,
     )
 
+
+def _with_more_values[Data](
+    frame: _Frame[Data],
+) -> SumProductNode[Any, Data]:
+    """
+    `_with_values` for a node that has some of its values already,
+    they sit in front of its own children so this puts them all
+    where `_with_values` would have
+    """
+    node = frame.node
+    # New paths can change the order of the old values too
+    values = tuple(dict.fromkeys(frame.values))
+    if tuple(
+        islice(node.children, len(values))
+    ) == values and all(
+        added is child
+        for added, (_, child) in zip(frame.added, frame.children)
+    ):
+        return node
+
+    added = dict(zip(node.children, frame.added))
     return SumProductNode(
         node.sop,
-        children,
+        frozendict[str, SumProductChild[Data]](
+            {
+                **{
+                    value: added.get(value, UNIT)
+                    for value in values
+                },
+                **added,
+            }
+        ),
         node.data,
     )
+
+
+def add_values_at_trie(
+    node: SumProductNode[T, Data] | DeBruijn,
+    trie: PathTrie,
+    prev_stack: Env[SumProductNode[Any, Data]] | None = None,
+    values_added: bool = False,
+) -> SumProductNode[T, Data] | DeBruijn:
+    """
+    `add_values_at_paths` with the paths already in a trie, so
+    each node only looks up its own children in the trie nodes
+    still in play rather than rescanning every path
+
+    The trie nodes partway through a path get passed on to match
+    anywhere below too. This runs once per CSV row, so it's its
+    own loop rather than a `fold`: subtrees nothing got added to
+    come back as they were, and the nodes above are already on
+    the stack for looking up de Bruijn indices
+
+    `values_added` is for when `node` came out of this already, with
+    some of `trie`'s paths. Only the rest get added, and everything
+    ends up where adding them all at once would have put it. The
+    recursion got unrolled the first time so isn't again, and the
+    values already there aren't looked inside
+    """
+    frames: list[_Frame[Data]] = []
+
+    def ancestor(index: DeBruijn) -> SumProductNode[Any, Data]:
+        if index < len(frames):
+            return frames[-1 - index].node
+        assert prev_stack is not None
+        return prev_stack[index - len(frames)]
+
+    def ends(tries: tuple[PathTrie, ...]) -> tuple[str, ...]:
+        return tuple(
+            value
+            for trie in tries
+            for value in trie.end_children
+        )
+
+    child: SumProductChild[Data] = node
+    tries: tuple[PathTrie, ...] = (trie,)
+    values = ends(tries)
+    active: tuple[PathTrie, ...] = ()
+    recursing = values_added
+    old_value = False
+    with_values = (
+        _with_more_values if values_added else _with_values
+    )
+    while True:
+        result: SumProductChild[Data] | None = None
+        if old_value:
+            # A value from last time, there's nothing below it
+            result = child
+        elif isinstance(child, DeBruijn):
+            if recursing:
+                result = child
+            else:
+                child = ancestor(child)
+                recursing = True
+
+        if result is None:
+            assert not isinstance(child, DeBruijn)
+            if active:
+                # Only the tries new here can add new values
+                in_play = {id(trie) for trie in tries}
+                new_tries = tuple(
+                    {
+                        id(trie): trie
+                        for trie in active
+                        if id(trie) not in in_play
+                    }.values()
+                )
+                tries = (*tries, *new_tries)
+                values = (*values, *ends(new_tries))
+            if child.children:
+                frames.append(
+                    _Frame(
+                        child,
+                        tries,
+                        recursing,
+                        values,
+                        (
+                            frozenset(values)
+                            if values_added
+                            else frozenset()
+                        ),
+                        list(child.children.items()),
+                        [],
+                    )
+                )
+            elif values:
+                result = SumProductNode(
+                    child.sop,
+                    frozendict[str, SumProductChild[Data]](
+                        {value: UNIT for value in values}
+                    ),
+                    child.data,
+                )
+            else:
+                result = child
+
+        while result is not None:
+            if not frames:
+                return cast(
+                    SumProductNode[T, Data] | DeBruijn, result
+                )
+            frames[-1].added.append(result)
+            if len(frames[-1].added) < len(frames[-1].children):
+                break
+            result = with_values(frames.pop())
+
+        frame = frames[-1]
+        path, child = frame.children[len(frame.added)]
+        tries = frame.tries
+        values = frame.values
+        recursing = frame.recursing
+        old_value = child is UNIT and path in frame.value_set
+        active = (
+            ()
+            if old_value
+            else tuple(
+                trie.children[path]
+                for trie in tries
+                if path in trie.children
+            )
+        )
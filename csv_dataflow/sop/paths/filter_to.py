@@ -1,58 +1,92 @@
 from typing import Any, Collection, TypeVar
 
 from frozendict import frozendict
-from csv_dataflow.cons import Cons, ConsList, at_index
+from csv_dataflow.env import Env, push
+from csv_dataflow.fold import fold
 from csv_dataflow.sop import (
     DeBruijn,
     SumProductChild,
     SumProductNode,
     SumProductPath,
 )
-
+from csv_dataflow.sop.paths.trie import PathTrie
 
 T = TypeVar("T")
 Data = TypeVar("Data", default=None)
 
+type _FilterItem[Data] = tuple[
+    SumProductNode[Any, Data] | DeBruijn,
+    PathTrie | None,
+    Env[SumProductNode[Any, Data]] | None,
+]
+type _FilterState[Data] = tuple[
+    SumProductNode[Any, Data] | None, bool
+]
+"""
+What it's filtered to without looking at the children, or the
+node they're going to be filtered under
+"""
+
 
 def filter_to_paths(
     node: SumProductNode[T, Data] | DeBruijn,
-    paths: Collection[SumProductPath[T]],
-    prev_stack: ConsList[SumProductNode[Any, Data]] = None,
+    paths: Collection[SumProductPath[T]] | PathTrie,
+    prev_stack: Env[SumProductNode[Any, Data]] | None = None,
 ) -> SumProductNode[T, Data] | None:
-    """These paths have to be anchored at the root"""
-    if not paths:
-        return None
+    """
+    These paths have to be anchored at the root. Put them in a
+    trie first if filtering to the same paths more than once
+    """
+    if not isinstance(paths, PathTrie):
+        paths = PathTrie.from_paths(paths)
 
-    if isinstance(node, int):
-        node = at_index(prev_stack, node)
+    def expand(
+        item: _FilterItem[Data],
+    ) -> tuple[
+        _FilterState[Data], tuple[_FilterItem[Data], ...]
+    ]:
+        node, trie, prev_stack = item
+        if trie is None:
+            return (None, True), ()
 
-    if () in paths:
-        return node
+        if isinstance(node, int):
+            assert prev_stack is not None
+            node = prev_stack[node]
 
-    children = frozendict[str, SumProductChild[Data]](
-        {
-            child_path: filtered_child
+        if trie.is_end:
+            return (node, True), ()
+
+        stack = push(prev_stack, node)
+        return (node, False), tuple(
+            (child, trie.children.get(child_path), stack)
             for child_path, child in node.children.items()
-            for filtered_child in (
-                filter_to_paths(
-                    child,
-                    tuple(
-                        path[1:]
-                        for path in paths
-                        if path[0] == child_path
-                    ),
-                    Cons(node, prev_stack),
-                ),
-            )
-            if filtered_child is not None
-        }
-    )
-
-    if not children:
-        return None
-
-    return SumProductNode(
-        node.sop,
-        children,
-        node.data,
-    )
+        )
+
+    def combine(
+        state: _FilterState[Data],
+        filtered: list[SumProductNode[Any, Data] | None],
+    ) -> SumProductNode[Any, Data] | None:
+        node, done = state
+        if done or node is None:
+            return node
+
+        children = frozendict[str, SumProductChild[Data]](
+            {
+                child_path: filtered_child
+                for child_path, filtered_child in zip(
+                    node.children, filtered
+                )
+                if filtered_child is not None
+            }
+        )
+
+        if not children:
+            return None
+
+        return SumProductNode(
+            node.sop,
+            children,
+            node.data,
+        )
+
+    return fold((node, paths, prev_stack), expand, combine)
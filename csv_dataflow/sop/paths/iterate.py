@@ -1,3 +1,4 @@
+from collections import deque
 from typing import Iterator, TypeVar
 from csv_dataflow.sop import (
     DeBruijn,
@@ -12,17 +13,26 @@ Data = TypeVar("Data", default=None)
 def iterate_leaves(
     sop: SumProductNode[T, Data], prefix: SumProductPath[T] = ()
 ) -> Iterator[SumProductPath[T]]:
-    if not sop.children:
-        yield prefix
-    else:
-        for child_path, child in sop.children.items():
-            assert not isinstance(
-                child, int
-            ), "Flat iterating over a recursive type is probably a mistake"
-            for path in iterate_leaves(
-                child, (*prefix, child_path)
-            ):
-                yield path
+    to_visit: list[
+        tuple[
+            SumProductNode[T, Data] | DeBruijn, SumProductPath[T]
+        ]
+    ] = [(sop, prefix)]
+    while to_visit:
+        node, path = to_visit.pop()
+        assert not isinstance(
+            node, int
+        ), "Flat iterating over a recursive type is probably a mistake"
+
+        if not node.children:
+            yield path
+        else:
+            to_visit.extend(
+                (child, (*path, child_path))
+                for child_path, child in reversed(
+                    tuple(node.children.items())
+                )
+            )
 
 
 def iterate_every(
@@ -36,45 +46,32 @@ def iterate_every(
 def iterate_every_with_data(
     sop: SumProductNode[T, Data] | DeBruijn,
     prefix: SumProductPath[T] = (),
+    truthy_only: bool = False,
 ) -> Iterator[tuple[SumProductPath[T], Data]]:
     """
     Iterates over every path, not just leaves
 
-    Starts with the root () and works downwards
+    Starts with the root () and works downwards a level at a time,
+    optionally only where the data is truthy
 
     Does not include recursed paths
     (come back and add a flag if you want that)
     """
-    if isinstance(sop, DeBruijn):
-        return
-
-    yield prefix, sop.data
-
-    level = len(prefix) + 1
-
-    child_iterators = tuple(
-        iterate_every_with_data(child, (*prefix, child_path))
-        for child_path, child in sop.children.items()
-    )
-    next_paths = tuple(next(it) for it in child_iterators)
-
-    while child_iterators:
-        new_child_iterators: list[
-            Iterator[tuple[SumProductPath[T], Data]]
-        ] = []
-        new_next_paths: list[tuple[SumProductPath[T], Data]] = []
-        for next_path, child_iterator in zip(
-            next_paths, child_iterators
-        ):
-            yield next_path
-            for path in child_iterator:
-                if len(path) > level:
-                    new_child_iterators.append(child_iterator)
-                    new_next_paths.append(path)
-                    break
-
-                yield path
+    # Each path is made once, and then its children's go on the
+    # end of it
+    to_visit = deque[
+        tuple[
+            SumProductNode[T, Data] | DeBruijn, SumProductPath[T]
+        ]
+    ]([(sop, prefix)])
+    while to_visit:
+        node, path = to_visit.popleft()
+        if isinstance(node, DeBruijn):
+            continue
 
-        child_iterators = tuple(new_child_iterators)
-        next_paths = tuple(new_next_paths)
-        level += 1
+        if node.data or not truthy_only:
+            yield path, node.data
+        to_visit.extend(
+            (child, (*path, child_path))
+            for child_path, child in node.children.items()
+        )
@@ -0,0 +1,69 @@
+from __future__ import annotations
+from dataclasses import dataclass, field
+from typing import Any, Iterable
+
+from csv_dataflow.sop import SOPPathElement, SumProductPath
+
+
+@dataclass
+class PathTrie:
+    """
+    Prefix tree of SOP paths, so a traversal can pick up every
+    path continuing through a child with one dict lookup instead
+    of rescanning the whole path collection
+
+    Paths can be labelled (e.g. with the CSV row they came from).
+    `labels` is every label of a path passing through or ending
+    at this node, `ends` just the ones ending here
+    """
+
+    children: dict[SOPPathElement, PathTrie] = field(
+        default_factory=dict[SOPPathElement, "PathTrie"]
+    )
+    ends: set[int] = field(default_factory=set[int])
+    labels: set[int] = field(default_factory=set[int])
+    end_children: dict[SOPPathElement, PathTrie] = field(
+        default_factory=dict[SOPPathElement, "PathTrie"]
+    )
+    """
+    The children paths end at, in the order the first path ending
+    at each was added rather than the order they turned up in
+    """
+
+    @classmethod
+    def from_paths(
+        cls, paths: Iterable[SumProductPath[Any]], label: int = 0
+    ) -> PathTrie:
+        trie = cls()
+        for path in paths:
+            trie.add(path, label)
+        return trie
+
+    def add(
+        self, path: SumProductPath[Any], label: int = 0
+    ) -> None:
+        parent = None
+        node = self
+        node.labels.add(label)
+        for element in path:
+            child = node.children.get(element)
+            if child is None:
+                child = node.children[element] = PathTrie()
+            parent, node = node, child
+            node.labels.add(label)
+        if parent is not None and not node.ends:
+            parent.end_children[path[-1]] = node
+        node.ends.add(label)
+
+    def __contains__(self, path: SumProductPath[Any]) -> bool:
+        node = self
+        for element in path:
+            child = node.children.get(element)
+            if child is None:
+                return False
+            node = child
+        return node.is_end
+
+    @property
+    def is_end(self) -> bool:
+        return bool(self.ends)
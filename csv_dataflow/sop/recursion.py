@@ -41,8 +41,5 @@ def max_de_bruijn_index_relative_to_current_node(
 
 
 def is_empty_recursion(sop: SumProductNode[T, Data]) -> bool:
-    return (
-        only_has_de_bruijn_indices(sop)
-        and max_de_bruijn_index_relative_to_current_node(sop)
-        <= 0
-    )
+    only_de_bruijn, max_index = sop.recursion_flags()
+    return only_de_bruijn and max_index <= 0
@@ -0,0 +1,481 @@
+import os
+from pathlib import Path
+from random import Random
+from typing import Any
+
+from frozendict import frozendict
+import pytest
+
+from csv_dataflow.csv import (
+    CSVReader,
+    IngestMode,
+    UnknownCSVColumns,
+    iter_relations_from_csv,
+    parallel_relation_from_csv,
+)
+from csv_dataflow.csv.batch import (
+    CSVSpec,
+    parallel_relations_from_csvs,
+)
+from csv_dataflow.csv.cache import (
+    RelationCache,
+    cached_parallel_relation_from_csv,
+    sop_fingerprint,
+)
+from csv_dataflow.csv.incremental import (
+    incremental_relation_from_csv,
+)
+from csv_dataflow.csv.parallel import (
+    parallel_relation_from_csv_in_processes,
+)
+from csv_dataflow.relation import BasicRelation
+from csv_dataflow.relation.intern import RelationInterner
+from csv_dataflow.sop import (
+    UNIT,
+    VOID,
+    DeBruijn,
+    SumProductChild,
+    SumProductNode,
+)
+from examples.ex1.types import A, B
+from examples.netcdf_to_grib.types import GRIB, NetCDF
+
+
+def write_csv(path: Path, text: str) -> Path:
+    path.write_text(text)
+    return path
+
+
+@pytest.fixture
+def recursive_csv(tmp_path: Path) -> Path:
+    """Values under list heads, and one named like a list end"""
+    return write_csv(
+        tmp_path / "recursive.csv",
+        "name,slots / list / head,head,,x,slots\n"
+        "a,1,,,1,\n"
+        "b,,2,,3,empty\n"
+        ",3,4,,5,\n",
+    )
+
+
+@pytest.mark.parametrize(
+    "s, t, csv_path",
+    (
+        (A, B, Path("examples/ex1/a_name_to_b_code.csv")),
+        (A, B, Path("examples/ex1/a_name_to_b_option.csv")),
+        (
+            NetCDF,
+            GRIB,
+            Path("examples/netcdf_to_grib/mapping.csv"),
+        ),
+    ),
+)
+def test_trie_ingest_examples(s: type, t: type, csv_path: Path):
+    assert parallel_relation_from_csv(
+        s, t, csv_path
+    ) == parallel_relation_from_csv(s, t, csv_path, "trie")
+
+
+def test_trie_ingest_recursive(recursive_csv: Path):
+    assert parallel_relation_from_csv(
+        A, B, recursive_csv
+    ) == parallel_relation_from_csv(A, B, recursive_csv, "trie")
+
+
+def test_trie_ingest_many_distinct_values(tmp_path: Path):
+    # Nearly every row has its own values, so the value nodes are
+    # as wide as there are rows
+    rows = 2000
+    random = Random(0)
+    csv_path = write_csv(
+        tmp_path / "wide.csv",
+        "name,,x,y,Option1 / m,o\n"
+        + "".join(
+            ",".join(
+                (
+                    str(random.randrange(rows))
+                    if column != 1
+                    else ""
+                )
+                for column in range(6)
+            )
+            + "\n"
+            for _ in range(rows)
+        ),
+    )
+    assert parallel_relation_from_csv(
+        A, B, csv_path
+    ) == parallel_relation_from_csv(A, B, csv_path, "trie")
+
+
+def test_unknown_column(tmp_path: Path):
+    csv_path = write_csv(
+        tmp_path / "unknown.csv",
+        "name,nmae,,x,Code / w\na,,,1,\n",
+    )
+    with pytest.raises(UnknownCSVColumns) as e:
+        parallel_relation_from_csv(A, B, csv_path)
+    assert "'nmae'" in str(e.value)
+    assert "'Code / w'" in str(e.value)
+
+
+@pytest.mark.parametrize("mode", ("per_row", "trie"))
+@pytest.mark.parametrize("reader", ("text", "mmap"))
+def test_stream(
+    recursive_csv: Path, mode: IngestMode, reader: CSVReader
+):
+    triple = parallel_relation_from_csv(A, B, recursive_csv)
+    stream = iter_relations_from_csv(
+        A, B, recursive_csv, mode, reader
+    )
+    # So there's more than one batch
+    stream.batch_rows = 2
+    assert tuple(stream) == triple.relation.children
+    assert stream.source.with_values == triple.source
+    assert stream.target.with_values == triple.target
+
+
+def test_in_processes(tmp_path: Path):
+    csv_path = write_csv(
+        tmp_path / "quoted.csv",
+        "name,head,,x,o\n"
+        + "a,1,,1,\n" * 5
+        + '"line\nbreak",",",,2,"say ""hi"""\n' * 5
+        + 'b,,,,"\n"\n' * 5,
+    )
+    for mode in ("per_row", "trie"):
+        assert parallel_relation_from_csv(
+            A, B, csv_path
+        ) == parallel_relation_from_csv_in_processes(
+            A,
+            B,
+            csv_path,
+            max_workers=2,
+            chunk_bytes=20,
+            mode=mode,
+        )
+
+
+def test_cache(tmp_path: Path, recursive_csv: Path):
+    cache = RelationCache(tmp_path / "cache", max_entries=1)
+    triple = parallel_relation_from_csv(A, B, recursive_csv)
+
+    assert (
+        cached_parallel_relation_from_csv(
+            A, B, recursive_csv, cache
+        )
+        == triple
+    )
+    (entry,) = (tmp_path / "cache").iterdir()
+    assert (
+        cached_parallel_relation_from_csv(
+            A, B, recursive_csv, cache
+        )
+        == triple
+    )
+    assert tuple((tmp_path / "cache").iterdir()) == (entry,)
+
+    # Another mode gets its own entry
+    assert (
+        cached_parallel_relation_from_csv(
+            A, B, recursive_csv, cache, "trie"
+        )
+        == triple
+    )
+    (trie_entry,) = (tmp_path / "cache").iterdir()
+    assert trie_entry != entry
+
+    # Different content, so a new entry which evicts the old one
+    write_csv(recursive_csv, "name,,x\na,,1\n")
+    cached_parallel_relation_from_csv(A, B, recursive_csv, cache)
+    (new_entry,) = (tmp_path / "cache").iterdir()
+    assert new_entry != entry
+
+
+def test_cache_stale_entries(tmp_path: Path):
+    cache = RelationCache(tmp_path / "cache")
+    cache.store("renamed", None)
+    cache.store("moved", None)
+    # What pickles of classes since renamed or moved look like
+    cache.entry_path("renamed").write_bytes(
+        b"ccsv_dataflow.csv.cache\nNoSuchClass\n."
+    )
+    cache.entry_path("moved").write_bytes(
+        b"cno_such_module\nRelationCache\n."
+    )
+    for key in ("renamed", "moved"):
+        assert cache.load(key) is None
+        assert not cache.entry_path(key).exists()
+
+
+def test_cache_store_fails(
+    tmp_path: Path,
+    recursive_csv: Path,
+    caplog: pytest.LogCaptureFixture,
+):
+    cache = RelationCache(tmp_path / "cache")
+    cache.store("unpicklable", lambda: None)
+    assert "Couldn't store unpicklable" in caplog.text
+    assert not any(cache.directory.iterdir())
+    assert cache.load("unpicklable") is None
+
+    # Where the cache should go is taken, so it's just a miss
+    taken = RelationCache(write_csv(tmp_path / "taken", ""))
+    assert cached_parallel_relation_from_csv(
+        A, B, recursive_csv, taken
+    ) == parallel_relation_from_csv(A, B, recursive_csv)
+
+
+def test_fingerprint_deep():
+    deep: SumProductNode[Any] = VOID
+    for i in range(5000):
+        deep = SumProductNode("*", {"x": deep, "y": i})
+    fingerprint = sop_fingerprint(deep)
+    assert sop_fingerprint(deep) == fingerprint
+    assert (
+        sop_fingerprint(SumProductNode("*", {"x": deep}))
+        != fingerprint
+    )
+
+
+@pytest.mark.parametrize("mode", ("per_row", "trie"))
+def test_incremental(
+    tmp_path: Path, recursive_csv: Path, mode: IngestMode
+):
+    incremental = incremental_relation_from_csv(
+        A,
+        B,
+        recursive_csv,
+        RelationCache(tmp_path / "cache"),
+        mode,
+    )
+    assert incremental.triple == parallel_relation_from_csv(
+        A, B, recursive_csv
+    )
+    unchanged = incremental.triple.relation.children[0][0]
+    assert not incremental.refresh()
+
+    # Change a row, add one and drop the last
+    write_csv(
+        recursive_csv,
+        "name,slots / list / head,head,,x,slots\n"
+        "a,1,,,1,\n"
+        "b,,7,,3,empty\n"
+        "c,,,,2,\n",
+    )
+    assert incremental.refresh()
+    assert incremental.triple == parallel_relation_from_csv(
+        A, B, recursive_csv
+    )
+    assert (
+        incremental.triple.relation.children[0][0] is unchanged
+    )
+
+    # Starting again comes from the cache
+    assert incremental_relation_from_csv(
+        A,
+        B,
+        recursive_csv,
+        RelationCache(tmp_path / "cache"),
+        mode,
+    ).triple == parallel_relation_from_csv(A, B, recursive_csv)
+
+
+def test_incremental_bad_header(tmp_path: Path):
+    csv_path = tmp_path / "typo.csv"
+    edits = 0
+
+    def edit(text: str) -> None:
+        # A fixed typo can leave the size the same, so make sure
+        # the modification time moves on
+        nonlocal edits
+        edits += 1
+        write_csv(csv_path, text)
+        os.utime(csv_path, ns=(edits * 10**9, edits * 10**9))
+
+    edit("nmae,,x\n" "a,,1\n")
+    incremental = incremental_relation_from_csv(A, B, csv_path)
+    for _ in range(2):
+        with pytest.raises(UnknownCSVColumns):
+            incremental.triple
+
+    edit("name,,x\n" "a,,1\n")
+    assert incremental.triple == parallel_relation_from_csv(
+        A, B, csv_path
+    )
+
+    # Not the last good triple, until it's fixed
+    edit("name,,x\n" "a,,1\n" "b,,2\n")
+    edit("name,,xx\n" "a,,1\n" "b,,2\n")
+    for _ in range(2):
+        with pytest.raises(UnknownCSVColumns):
+            incremental.triple
+
+    edit("name,,x\n" "a,,1\n" "b,,2\n")
+    assert incremental.triple == parallel_relation_from_csv(
+        A, B, csv_path
+    )
+
+
+def child_order(sop: SumProductChild[Any]) -> Any:
+    if isinstance(sop, DeBruijn):
+        return sop
+    return [
+        (name, child_order(c))
+        for name, c in sop.children.items()
+    ]
+
+
+def test_incremental_new_values(recursive_csv: Path):
+    incremental = incremental_relation_from_csv(
+        A, B, recursive_csv
+    )
+    rows = "a,1,,,1,\n" "b,,2,,3,empty\n" ",3,4,,5,\n"
+    # New values after the old ones, then before them, some under
+    # the recursion, and none going away
+    for text in (
+        rows + "e,6,,,1,\n",
+        "d,,8,,9,\n" + rows + "e,6,,,1,\n",
+    ):
+        before = incremental.triple
+        write_csv(
+            recursive_csv,
+            "name,slots / list / head,head,,x,slots\n" + text,
+        )
+        assert incremental.refresh()
+        fresh = parallel_relation_from_csv(A, B, recursive_csv)
+        assert incremental.triple == fresh
+        for after, from_scratch in (
+            (incremental.triple.source, fresh.source),
+            (incremental.triple.target, fresh.target),
+        ):
+            assert child_order(after) == child_order(
+                from_scratch
+            )
+        assert incremental.triple.source is not before.source
+
+
+def test_duplicate_rows_shared(tmp_path: Path):
+    csv_path = write_csv(
+        tmp_path / "duplicates.csv",
+        "name,,x,o\n" "a,,1,\n" "b,,1,\n" "a,,1,\n" "a,,,2\n",
+    )
+    for mode in ("per_row", "trie"):
+        relation = parallel_relation_from_csv(
+            A, B, csv_path, mode
+        ).relation
+        (a1, _), (b1, _), (a2, _), (a3, _) = relation.children
+        assert a1 is a2
+        assert isinstance(a1, BasicRelation)
+        assert isinstance(b1, BasicRelation)
+        assert isinstance(a3, BasicRelation)
+        assert a1.source is a3.source
+        assert a1.target is b1.target
+        assert tuple(
+            count for *_, count in relation.counted_children()
+        ) == (2, 1, 1)
+
+
+def test_interner_deep():
+    def deep() -> SumProductNode[Any]:
+        sop: SumProductNode[Any] = VOID
+        for _ in range(5000):
+            sop = SumProductNode(
+                "*",
+                frozendict[str, SumProductNode[Any]](
+                    {"x": sop, "y": VOID}
+                ),
+            )
+        return sop
+
+    interner = RelationInterner()
+    interned = interner.node(deep())
+    again = deep()
+    assert interner.node(again) is interned
+    assert interner.node(again.at(("x",))) is interned.at(("x",))
+
+
+def test_interner_child_order():
+    # Option1 and Option2 both have an m with both bools, but the
+    # rows put them in in a different order
+    csv_path = Path("examples/ex1/a_name_to_b_option.csv")
+    triple = parallel_relation_from_csv(A, B, csv_path)
+    # Streaming doesn't intern
+    stream = iter_relations_from_csv(A, B, csv_path)
+    tuple(stream)
+    for path in (
+        ("deets", "Option1", "m"),
+        ("deets", "Option2", "m"),
+    ):
+        assert list(triple.target.at(path).children) == list(
+            stream.target.with_values.at(path).children
+        )
+
+    a = SumProductNode[Any](
+        "*",
+        frozendict[str, SumProductNode[Any]](
+            {"x": VOID, "y": UNIT}
+        ),
+    )
+    b = SumProductNode[Any](
+        "*",
+        frozendict[str, SumProductNode[Any]](
+            {"y": UNIT, "x": VOID}
+        ),
+    )
+    interner = RelationInterner()
+    assert interner.node(a) is a
+    assert interner.node(b) is b
+    assert list(interner.node(b).children) == ["y", "x"]
+
+
+@pytest.mark.parametrize("mode", ("per_row", "trie"))
+def test_batch(recursive_csv: Path, mode: IngestMode):
+    specs = (
+        CSVSpec(A, B, Path("examples/ex1/a_name_to_b_code.csv")),
+        CSVSpec(
+            A, B, Path("examples/ex1/a_name_to_b_option.csv")
+        ),
+        CSVSpec(A, B, recursive_csv),
+        CSVSpec(
+            NetCDF,
+            GRIB,
+            Path("examples/netcdf_to_grib/mapping.csv"),
+        ),
+    )
+    batch = parallel_relations_from_csvs(
+        specs, max_workers=2, mode=mode
+    )
+
+    for spec, triple in zip(specs, batch.triples):
+        assert triple == parallel_relation_from_csv(
+            spec.source, spec.target, spec.csv_path
+        )
+    assert batch.value_sops[A] == batch.triples[0].source.merge(
+        *(triple.source for triple in batch.triples[1:3])
+    )
+    assert (
+        batch.triples[0].source.children["slots"]
+        is batch.triples[1].source.children["slots"]
+    )
+
+
+def test_mmap_reader(tmp_path: Path):
+    csv_path = write_csv(
+        tmp_path / "mixed.csv",
+        "name,head,,x,o\r\n"
+        "a,1,,1,\r\n"
+        "\r\n"
+        '"line\nbreak",",",,2,"say ""hi"""\n'
+        "b,,,,é\n"
+        "c,3,,4",
+    )
+    for path in (
+        csv_path,
+        Path("examples/ex1/a_name_to_b_option.csv"),
+    ):
+        assert parallel_relation_from_csv(
+            A, B, path
+        ) == parallel_relation_from_csv(
+            A, B, path, reader="mmap"
+        )
@@ -0,0 +1,520 @@
+import gc
+import pickle
+from typing import Any, Optional
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, make_dataclass, replace
+from weakref import ref
+
+import pytest
+
+from csv_dataflow.sop import UNIT, VOID, SumProductNode
+from csv_dataflow.sop.clip import ClipContext
+from csv_dataflow.sop.from_type import sop_from_type
+from csv_dataflow.sop.intern import interned_node
+from csv_dataflow.sop.mapped import MappedChildren
+from csv_dataflow.sop.overlay import bool_overlay
+from csv_dataflow.sop.paths.trie import PathTrie
+from csv_dataflow.sop.lazy import (
+    lazy_sop_from_type,
+    unforced_children,
+)
+from csv_dataflow.gui.state.user_state import SOPUserState
+from csv_dataflow.gui.visibility import compute_visible_sop
+from examples.ex1.types import A, B
+from examples.netcdf_to_grib.types import GRIB
+
+
+@dataclass(frozen=True)
+class Message:
+    text: str
+    replies: list["Message"]
+    parent: "Message | None"
+
+
+@dataclass(frozen=True)
+class Ping:
+    pong: "Pong"
+
+
+@dataclass(frozen=True)
+class Pong:
+    ping: Ping | None
+
+
+@dataclass(frozen=True)
+class Box[X]:
+    item: X
+    items: tuple[X, ...]
+
+
+def test_interned():
+    sop_b = sop_from_type(B)
+    interned = sop_b.interned()
+
+    assert interned == sop_b
+    assert interned is sop_from_type(B).interned()
+    # Option1 and Option2 both have m and n
+    option1 = interned.at(("deets", "Option1"))
+    option2 = interned.at(("deets", "Option2"))
+    assert option1.children["m"] is option2.children["n"]
+    assert (
+        sop_from_type(A).at(("slots", "empty")).interned()
+        is UNIT
+    )
+
+
+def test_interned_data():
+    assert interned_node("+", {}, 1) is not interned_node(
+        "+", {}, True
+    )
+    # Unhashable data just doesn't get shared
+    assert interned_node("+", {}, [1]) == interned_node(
+        "+", {}, [1]
+    )
+
+
+def test_interned_weak():
+    node = interned_node("+", {}, "only here")
+    assert interned_node("+", {}, "only here") is node
+
+    node_ref = ref(node)
+    del node
+    gc.collect()
+    assert node_ref() is None
+
+
+def test_cached_hash():
+    sop_b = sop_from_type(B)
+    other_b = sop_b.map_data(lambda data: data)
+    assert sop_b is not other_b
+
+    assert hash(sop_b) == hash(other_b)
+    assert sop_b == other_b
+    assert sop_b != sop_from_type(A)
+    unpickled = pickle.loads(pickle.dumps(sop_b))
+    assert unpickled == sop_b
+    # The hash isn't carried across processes
+    assert getattr(unpickled, "_hash") is None
+
+
+def test_slots():
+    sop_b = sop_from_type(B)
+    assert not hasattr(sop_b, "__dict__")
+    assert replace(sop_b, data=1).data == 1
+
+
+def test_arena():
+    for t in (A, B, GRIB):
+        sop = sop_from_type(t)
+        arena = sop.arena()
+        assert arena.to_sop() == sop
+        assert pickle.loads(pickle.dumps(arena)).to_sop() == sop
+
+    sop_grib = sop_from_type(GRIB).add_values_at_paths(
+        {("section_4", "Template4_0", "number", "1")}
+    )
+    arena_grib = sop_grib.arena()
+    for path in sop_grib.iter_all_paths():
+        assert arena_grib.to_sop(
+            arena_grib.at(path)
+        ) == sop_grib.at(path)
+    assert tuple(arena_grib.iter_leaf_paths(("g",))) == tuple(
+        sop_grib.iter_leaf_paths(("g",))
+    )
+    for prefix in ((), ("g",)):
+        assert tuple(
+            arena_grib.iter_all_paths_with_data(prefix)
+        ) == tuple(sop_grib.iter_all_paths_with_data(prefix))
+
+    sop_a = sop_from_type(A)
+    arena_a = sop_a.arena()
+    for path in (
+        ("slots", "list", "tail"),
+        (
+            "slots",
+            "list",
+            "tail",
+            "list",
+            "tail",
+            "list",
+            "head",
+        ),
+    ):
+        assert arena_a.to_sop(arena_a.at(path)) == sop_a.at(path)
+
+
+def test_arena_clip():
+    sop_a = sop_from_type(A)
+    clip_a = sop_a.replace_at(
+        ("slots", "list", "tail"),
+        sop_a.at(("slots",)).replace_at(
+            ("list",), replace(UNIT, children={"tail": UNIT})
+        ),
+    ).replace_at(("name",), replace(UNIT, children={"x": UNIT}))
+    clipped = sop_a.arena().clip(clip_a.arena())
+    assert clipped.to_sop() == sop_a.clip(clip_a)
+
+
+def test_clip_context():
+    sop_a = sop_from_type(A)
+    clip_a = sop_a.replace_at(
+        ("slots", "list", "tail"),
+        sop_a.at(("slots",)).replace_at(
+            ("list",), replace(UNIT, children={"tail": UNIT})
+        ),
+    ).replace_at(("name",), replace(UNIT, children={"x": UNIT}))
+    context = ClipContext(clip_a)
+    for path in (
+        ("slots", "list", "tail", "list", "tail", "list"),
+        ("slots", "list", "tail", "list"),
+        ("slots", "list", "head", "x"),
+        ("name", "x", "y"),
+        ("slots", "empty"),
+        (),
+    ):
+        assert context.clip_path(path) == clip_a.clip_path(path)
+    with pytest.raises(Exception):
+        context.clip_path(("slots", "nope"))
+
+    slots = sop_a.at(("slots",))
+    clipped = context.clip(slots, ("slots",))
+    assert clipped == slots.clip(clip_a.at(("slots",)))
+    assert context.clip(slots, ("slots",)) is clipped
+
+
+def test_path_index():
+    sop_a = sop_from_type(A)
+    path = (
+        "slots",
+        "list",
+        "tail",
+        "list",
+        "tail",
+        "list",
+        "head",
+    )
+    head = sop_a.at(path)
+    assert head is sop_a.at(("slots", "list", "head"))
+    assert sop_a.at(path) is head
+
+    # Only paths in the tree, however far down the list goes
+    nodes = sop_a.path_index().nodes
+    assert path not in nodes
+    size = len(nodes)
+    for length in range(1, 50):
+        sop_a.at(("slots", *("list", "tail") * length, "list"))
+    assert len(nodes) == size
+    assert (
+        getattr(pickle.loads(pickle.dumps(sop_a)), "_path_index")
+        is None
+    )
+
+
+def test_replace_many():
+    sop_a = sop_from_type(A).map_data(lambda _: 0)
+    name = SumProductNode[Any, int](
+        "*", {"x": UNIT.map_data(lambda _: 0)}, 0
+    )
+    nodes = {("name",): name}
+    data = {
+        (): 1,
+        ("slots", "list", "tail"): 2,
+        ("slots", "list", "tail", "list", "head"): 3,
+    }
+    replaced = sop_a.replace_many(nodes, data)
+
+    one_at_a_time = sop_a.replace_at(("name",), name)
+    for path, value in data.items():
+        one_at_a_time = one_at_a_time.replace_data_at(
+            path, value
+        )
+    assert replaced == one_at_a_time
+    assert replaced.at(("slots", "list", "tail")).data == 2
+    # The index is unrolled, so the original is left alone
+    assert replaced.at(("slots",)).data == 0
+    assert sop_a.replace_many() is sop_a
+
+
+def test_map_data_lazy():
+    sop_a = sop_from_type(A)
+    mapped: list[None] = []
+
+    def f(data: None) -> int:
+        mapped.append(data)
+        return 1
+
+    view = sop_a.map_data(f, lazy=True)
+    assert len(mapped) == 1
+    assert view.at(("slots", "list", "head")).data == 1
+    assert len(mapped) == 4
+    assert view.at(("slots", "list", "head")) is view.at(
+        ("slots", "list", "head")
+    )
+
+    eager = sop_a.map_data(lambda _: 1)
+    assert view == eager
+    assert hash(view) == hash(eager)
+    assert not isinstance(
+        pickle.loads(pickle.dumps(view)).children, MappedChildren
+    )
+    assert view.materialized() == eager
+    assert not isinstance(
+        view.materialized().children, MappedChildren
+    )
+
+    # Not a view, which would get worked out in full every time
+    # the session gets pickled
+    state = SOPUserState[A].from_sop(sop_a)
+    assert not isinstance(
+        state.selected.children, MappedChildren
+    )
+
+
+def test_paths_trie():
+    sop_a = sop_from_type(A)
+    value_paths = {("name", "x"), ("slots", "head", "1")}
+    trie = PathTrie.from_paths(value_paths)
+    with_values = sop_a.add_values_at_paths(trie)
+    assert with_values == sop_a.add_values_at_paths(value_paths)
+    assert with_values.at(("name", "x")) == UNIT
+    assert (
+        with_values.at(
+            ("slots", "list", "tail", "list", "head", "1")
+        )
+        == UNIT
+    )
+
+    paths = {("name", "x"), ("slots", "list", "head")}
+    filtered = with_values.filter_to_paths(
+        PathTrie.from_paths(paths)
+    )
+    assert filtered == with_values.filter_to_paths(paths)
+    assert filtered is not None
+    assert tuple(filtered.iter_all_paths()) == (
+        (),
+        ("name",),
+        ("slots",),
+        ("name", "x"),
+        ("slots", "list"),
+        ("slots", "list", "head"),
+        ("slots", "list", "head", "1"),
+    )
+    assert with_values.filter_to_paths(()) is None
+
+
+def test_paths_trie_value_order():
+    # In the order the paths end, not the order the trie first got
+    # to each value
+    sop: SumProductNode[Any] = SumProductNode(
+        "*", {"a": SumProductNode("*", {})}
+    )
+    paths = (("a", "q", "z"), ("a", "p"), ("a", "q"))
+    with_values = sop.add_values_at_paths(
+        PathTrie.from_paths(paths)
+    )
+    assert isinstance(with_values, SumProductNode)
+    a = with_values.children["a"]
+    assert isinstance(a, SumProductNode)
+    assert list(a.children) == ["p", "q"]
+
+
+def test_iter_all_paths_level_order():
+    sop = sop_from_type(Message).map_data(lambda _: 0)
+    sop = sop.replace_data_at(("parent", "NoneType"), 1)
+    # The recursion isn't followed
+    assert tuple(sop.iter_all_paths_with_data()) == (
+        ((), 0),
+        (("text",), 0),
+        (("replies",), 0),
+        (("parent",), 0),
+        (("replies", "empty"), 0),
+        (("replies", "list"), 0),
+        (("parent", "NoneType"), 1),
+    )
+    assert tuple(
+        sop.iter_all_paths_with_data(("m",), truthy_only=True)
+    ) == ((("m", "parent", "NoneType"), 1),)
+    assert tuple(
+        sop.arena().iter_all_paths_with_data(truthy_only=True)
+    ) == ((("parent", "NoneType"), 1),)
+
+
+def test_bool_overlay():
+    sop_grib = sop_from_type(GRIB)
+    base = sop_grib.arena()
+    unset = sop_grib.map_data(lambda _: False)
+    section = ("section_4", "Template4_0")
+    selected = bool_overlay(
+        unset.replace_data_at(section, True), base
+    )
+    expanded = bool_overlay(
+        unset.replace_data_at((), True), base
+    )
+    assert selected.at(section)
+    assert selected.to_sop() == unset.replace_data_at(
+        section, True
+    )
+
+    both = selected | expanded
+    assert len(both) == 2
+    assert not (selected & expanded).bits
+    assert both.any_under(0)
+    assert both.any_under(base.at(("section_4",)))
+    assert not both.any_under(base.at(section))
+    assert tuple(both.iter_set()) == (0, base.at(section))
+    assert both.with_bit(0, False) == selected
+
+    other_base: Any = sop_from_type(A).arena()
+    with pytest.raises(ValueError):
+        bool_overlay(unset, other_base)
+
+
+def test_deep():
+    depth = 2000
+    t: type[Any] = int
+    for i in range(depth):
+        t = make_dataclass(f"Nested{i}", [(f"x{i}", t)])
+    deepest = tuple(f"x{i}" for i in reversed(range(depth)))
+
+    sop = sop_from_type(t)
+    assert tuple(sop.iter_leaf_paths()) == (deepest,)
+    with_value = sop.add_values_at_paths({(*deepest, "1")})
+    assert tuple(with_value.iter_leaf_paths()) == (
+        (*deepest, "1"),
+    )
+    assert sop.filter_to_paths({deepest}) == sop
+    assert sop.clip(sop) == sop
+    assert sop.merge(sop.map_data(lambda _: None)) == sop
+    assert sop.interned() == sop
+
+
+def test_deep_de_bruijn():
+    # Every level pointing back to the root
+    depth = 2000
+    sop: SumProductNode[Any] = VOID
+    clip_sop: SumProductNode[Any] = VOID
+    for i in range(depth):
+        sop = SumProductNode("*", {"x": sop, "y": depth - 1 - i})
+        clip_sop = SumProductNode(
+            "*", {"x": clip_sop, "y": VOID}
+        )
+    deepest = ("x",) * (depth - 1)
+
+    assert sop.at((*deepest, "y", *deepest, "y")) is sop
+    assert sop.arena().at((*deepest, "y")) == 0
+    clipped = sop.clip(clip_sop)
+    assert clipped.at((*deepest, "y")) == replace(
+        sop, children={}
+    )
+    assert sop.interned() == sop
+    assert not sop.is_empty_recursion()
+
+    # Every level pointing back to the root again, with nothing
+    # at the bottom
+    looping: SumProductNode[Any] = SumProductNode(
+        "*", {"y": depth}
+    )
+    for i in range(depth):
+        looping = SumProductNode(
+            "*", {"x": looping, "y": depth - 1 - i}
+        )
+    assert looping.is_empty_recursion()
+    assert not looping.at(deepest).is_empty_recursion()
+
+
+def test_from_type_recursive():
+    sop = sop_from_type(Message)
+    assert sop is sop_from_type(Message)
+    assert sop.at(("replies", "list", "head")) is sop
+    assert sop.at(("parent", "Message")) is sop
+    assert sop.children["parent"] == SumProductNode(
+        "+", {"Message": 1, "NoneType": VOID}
+    )
+    assert sop.at(
+        ("replies", "list", "head", "parent", "Message", "text")
+    ) is sop.at(("text",))
+
+    ping = sop_from_type(Ping)
+    assert ping.at(("pong", "ping", "Ping")) is ping
+    assert (
+        ping.at(
+            ("pong", "ping", "Ping", "pong", "ping")
+        ).children["Ping"]
+        == 2
+    )
+    pong = sop_from_type(Pong)
+    assert pong.at(("ping", "Ping", "pong")) is pong
+    assert pong != ping.at(("pong",))
+
+
+def test_from_type_generic():
+    box = sop_from_type(Box[A])
+    assert box.at(("item",)) is sop_from_type(A)
+    assert box.at(("items", "list", "head")) is sop_from_type(A)
+    optional: Any = Optional[A]
+    union: Any = A | None
+    assert sop_from_type(optional).children.keys() == {
+        "A",
+        "NoneType",
+    }
+    assert sop_from_type(optional) == sop_from_type(union)
+
+
+def test_from_type_threads():
+    t = make_dataclass(
+        "Shared", [("message", Message), ("b", B)]
+    )
+    with ThreadPoolExecutor(8) as executor:
+        sops = set(
+            map(id, executor.map(sop_from_type, [t] * 32))
+        )
+    assert len(sops) == 1
+
+
+def is_forced(sop: SumProductNode[Any, Any]) -> bool:
+    return unforced_children(sop) is None
+
+
+def test_lazy_from_type():
+    for t in (A, B, GRIB, Message, Ping, Box[A]):
+        lazy = lazy_sop_from_type(t)
+        assert not is_forced(lazy)
+        assert lazy == sop_from_type(t)
+        assert hash(lazy_sop_from_type(t)) == hash(
+            sop_from_type(t)
+        )
+        assert pickle.loads(pickle.dumps(lazy)) == lazy
+
+    lazy = lazy_sop_from_type(Message)
+    deep = ("replies", "list", "head", "parent", "Message")
+    assert lazy.at(deep) is lazy
+    assert not is_forced(lazy.at(("text",)))
+    clip_sop = SumProductNode[Message](
+        "*",
+        {
+            "parent": SumProductNode(
+                "+",
+                {"Message": SumProductNode("*", {"text": VOID})},
+            )
+        },
+    )
+    assert lazy.clip(clip_sop) == sop_from_type(Message).clip(
+        clip_sop
+    )
+    lazy = lazy_sop_from_type(Message)
+    lazy.at(("parent", "Message", "text"))
+    assert not is_forced(lazy.at(("replies",)))
+
+    # Only what's visible gets worked out
+    grib = lazy_sop_from_type(GRIB)
+    state = SOPUserState[GRIB].from_sop(grib)
+    visible = compute_visible_sop(state.selected, state.expanded)
+    assert visible is not None
+    assert visible.children.keys() == grib.children.keys()
+    # Visible children, so their children are worked out, but not
+    # their children's
+    for child in state.selected.children.values():
+        assert isinstance(child, SumProductNode)
+        for grandchild in child.children.values():
+            assert isinstance(grandchild, SumProductNode)
+            assert not is_forced(grandchild)